@@ -0,0 +1,253 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the Bitboard class, which describes the unit cells of a
+board as one integer per colour so that goals can be scored with a few
+operations on whole integers.
+
+The unit cells are numbered as in block.Raster: cell i is the cell at column
+i // length and row i % length, and bit i of a colour's integer is set if
+that cell has the colour.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+
+from block import Block
+from goal import Goal, BlobGoal, PerimeterGoal
+from settings import colour_id
+
+# Cache of the masks used by Bitboard, keyed by the number of unit cells along
+# each side of a board.
+_MASKS: Dict[int, Tuple[int, int, int, int, int]] = {}
+
+# Cache of the integers with bit 0 of each of the first <width> columns set,
+# keyed by (length, width).
+_SPREADS: Dict[Tuple[int, int], int] = {}
+
+
+def _popcount(bits: int) -> int:
+    """Return the number of bits set in <bits>.
+
+    >>> _popcount(0b1011)
+    3
+    """
+    return bin(bits).count('1')
+
+
+def _masks(length: int) -> Tuple[int, int, int, int, int]:
+    """Return the masks of the top row, bottom row, left column and right
+    column of a board with <length> unit cells along each side, and the mask
+    of all of its cells, in that order.
+    """
+    if length not in _MASKS:
+        column = (1 << length) - 1
+        row = _spread(length, length)
+        _MASKS[length] = (row, row << (length - 1), column,
+                          column << (length * (length - 1)),
+                          (1 << (length * length)) - 1)
+    return _MASKS[length]
+
+
+def _spread(length: int, width: int) -> int:
+    """Return the integer with the bit of the first unit cell of each of the
+    first <width> columns set, on a board with <length> unit cells along each
+    side.
+
+    Multiplying a run of bits in the first column by this copies the run into
+    each of the first <width> columns.
+
+    >>> bin(_spread(4, 3))
+    '0b100010001'
+    """
+    key = (length, width)
+    if key not in _SPREADS:
+        _SPREADS[key] = sum(1 << (length * i) for i in range(width))
+    return _SPREADS[key]
+
+
+class Bitboard:
+    """The unit cells of a board, as one integer for each colour.
+
+    === Public Attributes ===
+    length:
+        The number of unit cells along each side of the board.
+    planes:
+        The integer of each colour id on the board, as given by
+        settings.colour_id. Colours that have no unit cells are left out.
+    """
+    length: int
+    planes: Dict[int, int]
+
+    def __init__(self, board: Block) -> None:
+        """Initialize this Bitboard with the unit cells of <board>.
+
+        Each leaf of <board> adds its whole square of unit cells to the
+        integer of its colour at once.
+        """
+        self.length = 2 ** (board.max_depth - board.level)
+        self.planes = {}
+        self._draw(board, 0, 0)
+
+    def _square(self, x: int, y: int, width: int) -> int:
+        """Return the mask of the <width> by <width> square of unit cells
+        whose upper left cell is at column <x> and row <y>.
+        """
+        return (((1 << width) - 1) * _spread(self.length, width)) << \
+            (x * self.length + y)
+
+    def _draw(self, block: Block, x: int, y: int) -> None:
+        """Add the unit cells of <block> to this Bitboard, with the upper left
+        unit cell of <block> at column <x> and row <y>.
+
+        Precondition: none of the cells of <block> are set in any plane.
+        """
+        planes = self.planes
+        for colour, dx, dy, width in block.leaf_cells():
+            ident = colour_id(colour)
+            planes[ident] = planes.get(ident, 0) | \
+                self._square(x + dx, y + dy, width)
+
+    def redrawn(self, block: Block) -> Bitboard:
+        """Return a new Bitboard that is this one with the square of <block>
+        drawn again from <block> as it is now.
+
+        Precondition: this Bitboard is of the board at the root of <block>'s
+        tree.
+        """
+        x, y, width = block.cell_region()
+        keep = ~self._square(x, y, width)
+        bitboard = Bitboard.__new__(Bitboard)
+        bitboard.length = self.length
+        bitboard.planes = {ident: plane & keep
+                           for ident, plane in self.planes.items()}
+        bitboard._draw(block, x, y)
+        return bitboard
+
+    def plane(self, colour: Tuple[int, int, int]) -> int:
+        """Return the integer of <colour>.
+        """
+        return self.planes.get(colour_id(colour), 0)
+
+    def perimeter_score(self, colour: Tuple[int, int, int]) -> int:
+        """Return the number of unit cells of <colour> on the perimeter of the
+        board, with corner cells counted twice.
+        """
+        plane = self.plane(colour)
+        top, bottom, left, right, _ = _masks(self.length)
+        return _popcount(plane & top) + _popcount(plane & bottom) + \
+            _popcount(plane & left) + _popcount(plane & right)
+
+    def blob_sizes(self, colour: Tuple[int, int, int]) -> List[int]:
+        """Return the number of unit cells in each blob of <colour>, in no
+        particular order.
+
+        Each blob is found by growing it from one of its cells in every
+        direction at once until it stops changing.
+        """
+        plane = self.plane(colour)
+        top, bottom, _, _, everything = _masks(self.length)
+        not_top = everything ^ top
+        not_bottom = everything ^ bottom
+        column = self.length
+        sizes = []
+        while plane:
+            blob = plane & -plane
+            while True:
+                # Cells moved off the left or right of the board fall outside
+                # <plane>, but cells moved off the top or bottom of a column
+                # would land in the next one, so those are masked out first.
+                grown = (blob | (blob & not_top) >> 1 |
+                         (blob & not_bottom) << 1 | blob >> column |
+                         blob << column) & plane
+                if grown == blob:
+                    break
+                blob = grown
+            sizes.append(_popcount(blob))
+            plane ^= blob
+        return sizes
+
+    def blob_score(self, colour: Tuple[int, int, int]) -> int:
+        """Return the number of unit cells in the largest blob of <colour>.
+        """
+        return max(self.blob_sizes(colour), default=0)
+
+
+def score_moves(board: Block, goal: Goal,
+                moves: List[Tuple[str, Optional[int], Block]],
+                colour: Optional[Tuple[int, int, int]] = None) -> List[int]:
+    """Return the score of <goal> on <board> after each of <moves>, with each
+    move made on its own. A move that can't be made scores the same as
+    <board> does. Paint moves use <colour>, or the colour of <goal> if
+    <colour> is None.
+
+    <board> is drawn as a Bitboard once. Each move is then made in place, only
+    the square of the Block it was made on is drawn again, and the move is
+    undone, so <board> ends up as it was.
+
+    Precondition: every move is on a Block of <board>
+    """
+    if colour is None:
+        colour = goal.colour
+    if isinstance(goal, PerimeterGoal):
+        score = Bitboard.perimeter_score
+    elif isinstance(goal, BlobGoal):
+        score = Bitboard.blob_score
+    elif colour == goal.colour:
+        return [goal.score(board) + goal.score_delta(board, move)
+                for move in moves]
+    else:
+        scores = []
+        for action, direction, block in moves:
+            undo = block.apply_move(action, direction, colour)
+            scores.append(goal.score(board))
+            if undo is not None:
+                undo.undo()
+        return scores
+    base = Bitboard(board)
+    base_score = score(base, goal.colour)
+    length = base.length
+    scores = []
+    for action, direction, block in moves:
+        if isinstance(goal, PerimeterGoal):
+            x, y, width = block.cell_region()
+            if x != 0 and y != 0 and x + width != length and \
+                    y + width != length:
+                # The move can't reach the perimeter.
+                scores.append(base_score)
+                continue
+        undo = block.apply_move(action, direction, colour)
+        if undo is None:
+            scores.append(base_score)
+            continue
+        scores.append(score(base.redrawn(block), goal.colour))
+        undo.undo()
+    return scores
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', '__future__', 'block', 'goal',
+            'settings'
+        ],
+        'max-attributes': 15
+    })
@@ -22,11 +22,23 @@ Misha Schwartz, and Jaisie Sin
 This file contains the Block class, the main data structure used in the game.
 """
 from __future__ import annotations
-from typing import Optional, Tuple, List
+from typing import Iterable, Iterator, Optional, Tuple, List, Union
 import random
 import math
+import weakref
 
-from settings import colour_name, COLOUR_LIST
+from settings import colour_name, colour_id, COLOUR_LIST
+
+# The (row, col) offset of each child, in units of the child size, in the order
+# that children are stored.
+_QUADRANT_OFFSETS = [(1, 0), (0, 0), (0, 1), (1, 1)]
+
+# The number of changed regions a Raster remembers for regions_changed_since.
+_RASTER_LOG_LENGTH = 64
+
+# The children of a Block that has had none since it was made, until they are
+# asked for. Most Blocks are leaves, so this saves making a list for each one.
+_NO_CHILDREN = ()
 
 
 def generate_board(max_depth: int, size: int) -> Block:
@@ -92,12 +104,52 @@ class Block:
         - its colour is not None.
     - level <= max_depth
     """
-    position: Tuple[int, int]
+    # === Private Attributes ===
+    # _position:
+    #   The position of this Block when it has no parent. A Block with a
+    #   parent derives its position from its parent instead.
+    # _parent_ref:
+    #   A weak reference to the Block that has this Block as a child, or None
+    #   if this Block is the root of its tree. The reference is weak so that a
+    #   tree that is no longer used is freed as soon as its root is, rather
+    #   than by the garbage collector.
+    # _index:
+    #   The index of this Block in its parent's list of children, before any
+    #   of the parent's pending turns are applied.
+    # _turns:
+    #   The number of clockwise quarter turns that have been applied to this
+    #   Block but not yet to the order of its children. Each child must also
+    #   be rotated by this many turns when they are applied. A leaf keeps
+    #   counting the turns passed on to it, so that children given back to it
+    #   by undoing a combine can be put in the right order.
+    # _children:
+    #   The children of this Block, before its pending turns are applied, or
+    #   _NO_CHILDREN if it has never had any and they have not been asked for.
+    # _colour:
+    #   The value of <colour>.
+    # _hashes:
+    #   The structural hashes of this Block's subtree with its children in
+    #   their stored order, rotated by 0, 1, 2 and 3 clockwise quarter turns,
+    #   or None if they have not been worked out since the subtree last
+    #   changed.
+    # _raster:
+    #   The unit cells of this Block's tree, kept while this Block is the root
+    #   of its tree once they have been asked for, or None.
+    #
+    # === Private Representation Invariants ===
+    # - 0 <= _turns < 4
+    # - If _hashes is None, then the _hashes of every ancestor is None.
     size: int
-    colour: Optional[Tuple[int, int, int]]
     level: int
     max_depth: int
-    children: List[Block]
+    _position: Tuple[int, int]
+    _parent_ref: Optional[weakref.ref]
+    _index: int
+    _turns: int
+    _children: Union[_Children, Tuple[()]]
+    _colour: Optional[Tuple[int, int, int]]
+    _hashes: Optional[List[int]]
+    _raster: Optional[Raster]
 
     def __init__(self, position: Tuple[int, int], size: int,
                  colour: Optional[Tuple[int, int, int]], level: int,
@@ -111,12 +163,194 @@ class Block:
             - level >= 0
             - max_depth >= level
         """
-        self.position = position
+        self._position = position
         self.size = size
-        self.colour = colour
+        self._colour = colour
+        self._hashes = None
         self.level = level
         self.max_depth = max_depth
-        self.children = []
+        self._parent_ref = None
+        self._index = 0
+        self._turns = 0
+        self._children = _NO_CHILDREN
+        self._raster = None
+
+    @property
+    def _parent(self) -> Optional[Block]:
+        """The Block that has this Block as a child, or None if this Block is
+        the root of its tree.
+        """
+        ref = self._parent_ref
+        if ref is None:
+            return None
+        return ref()
+
+    @property
+    def position(self) -> Tuple[int, int]:
+        """The (row, col) coordinates of the upper left corner of this Block.
+
+        The position of a Block with a parent is worked out from the root of
+        its tree and the path down to this Block, so it is never out of date
+        after a swap or rotate higher up in the tree.
+        """
+        if self._parent is None:
+            return self._position
+        root, route = self._route()
+        x, y = root._position
+        for parent, index in route:
+            dx, dy = _QUADRANT_OFFSETS[index]
+            # Children are offset by their own size, as smash places them.
+            half = parent._children[0].size
+            x += dx * half
+            y += dy * half
+        return x, y
+
+    @position.setter
+    def position(self, position: Tuple[int, int]) -> None:
+        """Set the position of this Block.
+
+        Raise a ValueError if this Block has a parent, since its position then
+        follows from the position of the root of its tree.
+        """
+        if self._parent is not None:
+            raise ValueError('only the root of a tree can be moved')
+        self._position = position
+
+    @property
+    def colour(self) -> Optional[Tuple[int, int, int]]:
+        """If this block is not subdivided, the colour of this Block.
+        Otherwise, None.
+        """
+        return self._colour
+
+    @colour.setter
+    def colour(self, colour: Optional[Tuple[int, int, int]]) -> None:
+        """Set the colour of this Block.
+        """
+        self._colour = colour
+        self._changed()
+
+    @property
+    def children(self) -> List[Block]:
+        """The blocks into which this block is subdivided, in this order:
+        upper-right child, upper-left child, lower-left child, lower-right
+        child.
+        """
+        if self._parent is not None:
+            self._settle()
+        children = self._ordered_children()
+        if children is _NO_CHILDREN:
+            # Give out a list that can be added to.
+            children = self._children = _Children.of(self)
+        return children
+
+    @children.setter
+    def children(self, children: List[Block]) -> None:
+        """Replace the children of this Block with <children>.
+        """
+        if self._parent is not None:
+            # Keep the turns pending higher up from reaching the new children.
+            self._settle()
+        self._children = _Children.of(self, children)
+        self._turns = 0
+        self._adopt_children()
+        self._changed()
+
+    def _ordered_children(self) -> List[Block]:
+        """Return the children of this Block in order, applying its pending
+        turns to them.
+
+        Precondition: none of this Block's ancestors has pending turns.
+        """
+        if self._turns and self._children:
+            self._apply_turns()
+        return self._children
+
+    def _route(self) -> Tuple[Block, List[Tuple[Block, int]]]:
+        """Return the root of this Block's tree, and a (parent, index) pair
+        for each step from that root down to this Block, where index is the
+        position of the next Block in parent's children.
+        """
+        ancestors = []
+        node = self
+        while node._parent is not None:
+            ancestors.append(node)
+            node = node._parent
+        route = []
+        turns = 0
+        for child in reversed(ancestors):
+            parent = child._parent
+            turns = (turns + parent._turns) % 4
+            route.append((parent, (child._index - turns) % 4))
+        return node, route
+
+    def path(self) -> List[int]:
+        """Return the indices of the children to follow from the root of this
+        Block's tree to reach this Block.
+
+        >>> board = Block((0, 0), 750, None, 0, 2)
+        >>> board.smash()
+        True
+        >>> board.children[2].path()
+        [2]
+        """
+        return [index for _, index in self._route()[1]]
+
+    def cell_region(self) -> Tuple[int, int, int]:
+        """Return the (column, row, width) of the square of unit cells that
+        this Block covers on the board at the root of its tree.
+
+        >>> board = Block((0, 0), 750, None, 0, 2)
+        >>> board.smash()
+        True
+        >>> board.children[3].cell_region()
+        (2, 2, 2)
+        """
+        root, route = self._route()
+        x = y = 0
+        width = 2 ** (self.max_depth - root.level)
+        for _, index in route:
+            width //= 2
+            dx, dy = _QUADRANT_OFFSETS[index]
+            x += dx * width
+            y += dy * width
+        return x, y, width
+
+    def _settle(self) -> None:
+        """Apply the pending turns of all of this Block's ancestors, so that
+        this Block's own children are in the right order once its own turns
+        are applied.
+        """
+        ancestors = []
+        node = self._parent
+        while node is not None:
+            ancestors.append(node)
+            node = node._parent
+        for node in reversed(ancestors):
+            if node._turns and node._children:
+                node._apply_turns()
+
+    def _adopt_children(self) -> None:
+        """Make this Block the parent of each of its children.
+        """
+        ref = weakref.ref(self)
+        for i, child in enumerate(self._children):
+            child._parent_ref = ref
+            child._index = i
+
+    def _apply_turns(self) -> None:
+        """Reorder this Block's children according to its pending turns, and
+        pass those turns on to the children.
+        """
+        turns = self._turns
+        self._turns = 0
+        children = self._children[turns:] + self._children[:turns]
+        if self._hashes is not None:
+            self._hashes = self._hashes[turns:] + self._hashes[:turns]
+        for child in children:
+            child._turns = (child._turns + turns) % 4
+        self._children = _Children.of(self, children)
+        self._adopt_children()
 
     def __str__(self) -> str:
         """Return this Block in a string format.
@@ -140,29 +374,209 @@ class Block:
 
             return result
 
+    def _changed(self) -> None:
+        """Record that this Block's subtree has changed, so its structural
+        hash and those of its ancestors must be worked out again.
+        """
+        self._forget_hashes()
+        self._mark_cells()
+
+    def _forget_hashes(self) -> None:
+        """Record that the structural hashes of this Block and its ancestors
+        must be worked out again.
+        """
+        node = self
+        while node is not None and node._hashes is not None:
+            node._hashes = None
+            node = node._parent
+
+    def _mark_cells(self) -> None:
+        """Record that the unit cells of this Block must be filled in again in
+        the raster of its tree, if the root of its tree keeps one.
+        """
+        root = self
+        while root._parent is not None:
+            root = root._parent
+        raster = root._raster
+        if raster is not None:
+            raster.mark(*self.cell_region())
+
+    def _stored_hashes(self) -> List[int]:
+        """Return the structural hashes of this Block's subtree with its
+        children in their stored order, rotated clockwise by 0, 1, 2 and 3
+        quarter turns.
+        """
+        hashes = self._hashes
+        if hashes is None:
+            if not self._children:
+                leaf = hash((self.level, self._colour))
+                hashes = [leaf, leaf, leaf, leaf]
+            else:
+                rotated = [child._rotated_hashes() for child in self._children]
+                # Rotating by q turns moves child (i + q) % 4 to index i, and
+                # rotates that child by q turns as well.
+                hashes = [hash((self.level, rotated[q][q],
+                                rotated[(q + 1) % 4][q],
+                                rotated[(q + 2) % 4][q],
+                                rotated[(q + 3) % 4][q]))
+                          for q in range(4)]
+            self._hashes = hashes
+        return hashes
+
+    def _rotated_hashes(self) -> List[int]:
+        """Return the structural hashes of this Block's subtree, taking its
+        pending turns into account, rotated clockwise by 0, 1, 2 and 3 quarter
+        turns.
+        """
+        hashes = self._stored_hashes()
+        turns = self._turns
+        if turns and self._children:
+            return hashes[turns:] + hashes[:turns]
+        return hashes
+
+    def structural_hash(self) -> int:
+        """Return a 64-bit hash of the colours and shape of this Block and all
+        its descendents.
+
+        Equal Blocks have equal hashes. The hash is kept for every subtree,
+        and a move only causes the hashes on the path from the moved Block
+        up to the root to be worked out again.
+        """
+        if self._parent is not None:
+            self._settle()
+        return self._rotated_hashes()[0]
+
     def __eq__(self, other: Block) -> bool:
         """Return True iff this Block and all its descendents are equivalent to
         the <other> Block and all its descendents.
         """
+        if self.structural_hash() != other.structural_hash():
+            return False
+        # The positions of the descendents follow from the position of this
+        # Block and the shape of the tree, so only the top needs comparing.
+        return self.position == other.position and self._same_tree(other)
+
+    def _same_tree(self, other: Block) -> bool:
+        """Return True iff this Block and all its descendents are equivalent to
+        the <other> Block and all its descendents, ignoring their positions.
+        """
         if len(self.children) == 0 and len(other.children) == 0:
             # Both self and other are leaves.
-            return self.position == other.position and \
-                   self.size == other.size and \
-                   self.colour == other.colour and \
-                   self.level == other.level and \
-                   self.max_depth == other.max_depth
+            return self.size == other.size and \
+                self.colour == other.colour and \
+                self.level == other.level and \
+                self.max_depth == other.max_depth
         elif len(self.children) != len(other.children):
             # One of self or other is a leaf while the other is not.
             return False
         else:
             # Both self and other have four children.
             for i in range(4):
-                # The != operator also uses the __eq__ special method.
-                if self.children[i] != other.children[i]:
+                if not self.children[i]._same_tree(other.children[i]):
                     return False
 
             return True
 
+    def leaf_cells(self) -> Iterator[Tuple[Tuple[int, int, int], int, int,
+                                           int]]:
+        """Yield a (colour, column, row, width) tuple for every leaf below or
+        at this Block, measured in unit cells from the upper left corner of
+        this Block.
+
+        >>> board = Block((0, 0), 750, (0, 0, 0), 0, 2)
+        >>> list(board.leaf_cells())
+        [((0, 0, 0), 0, 0, 4)]
+        """
+        if self._parent is not None:
+            self._settle()
+        stack = [(self, 0, 0, 2 ** (self.max_depth - self.level))]
+        while stack:
+            block, x, y, width = stack.pop()
+            children = block._ordered_children()
+            if not children:
+                yield block.colour, x, y, width
+            else:
+                half = width // 2
+                for child, (dx, dy) in zip(children, _QUADRANT_OFFSETS):
+                    stack.append((child, x + dx * half, y + dy * half, half))
+
+    def leaf_squares(self) -> Iterator[Tuple[Tuple[int, int, int],
+                                             Tuple[int, int], int]]:
+        """Yield a (colour, position, size) tuple for every leaf below or at
+        this Block, in pixels.
+
+        The positions are passed down from this Block rather than worked out
+        from the root for every leaf.
+
+        >>> board = Block((0, 0), 750, None, 0, 1)
+        >>> board.children = [Block((0, 0), 375, colour, 1, 1)
+        ...                   for colour in [(1, 1, 1), (2, 2, 2), (1, 1, 1),
+        ...                                  (3, 3, 3)]]
+        >>> ((2, 2, 2), (0, 0), 375) in board.leaf_squares()
+        True
+        """
+        if self._parent is not None:
+            self._settle()
+        stack = [(self, self.position)]
+        while stack:
+            block, position = stack.pop()
+            children = block._children
+            if not children:
+                yield block._colour, position, block.size
+            else:
+                if block._turns:
+                    children = block._ordered_children()
+                x, y = position
+                half = children[0].size
+                stack.append((children[0], (x + half, y)))
+                stack.append((children[1], position))
+                stack.append((children[2], (x, y + half)))
+                stack.append((children[3], (x + half, y + half)))
+
+    def raster(self) -> Raster:
+        """Return the unit cells of this Block as a Raster.
+
+        The root of a tree keeps its Raster, and each move made in the tree
+        marks the square it changed, so that only the marked squares are
+        filled in again the next time this is called. Any other Block returns
+        a new Raster every time.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[1], 0, 1)
+        >>> board.raster().cells
+        bytearray(b'\\x01\\x01\\x01\\x01')
+        >>> board.smash()
+        True
+        >>> board.children[0].colour = COLOUR_LIST[3]
+        >>> board.raster().cells[2]
+        3
+        """
+        length = 2 ** (self.max_depth - self.level)
+        if self._parent is not None:
+            raster = Raster(length)
+            raster.fill(self, 0, 0)
+            return raster
+        raster = self._raster
+        if raster is None:
+            raster = Raster(length)
+            raster.fill(self, 0, 0)
+            self._raster = raster
+            return raster
+        for x, y, width in raster.take_marked():
+            # Find the Block whose square is the marked one, or the leaf that
+            # now covers it.
+            block = self
+            bx = by = 0
+            bwidth = length
+            while bwidth > width and block.children:
+                bwidth //= 2
+                dx = 1 if x >= bx + bwidth else 0
+                dy = 1 if y >= by + bwidth else 0
+                bx += dx * bwidth
+                by += dy * bwidth
+                block = block.children[_QUADRANT_OFFSETS.index((dx, dy))]
+            raster.fill(block, bx, by)
+        return raster
+
     def _child_size(self) -> int:
         """Return the size of this Block's children.
         """
@@ -174,35 +588,10 @@ class Block:
         The positions are returned in this order: upper-right child, upper-left
         child, lower-left child, lower-right child.
         """
-        x = self.position[0]
-        y = self.position[1]
+        x, y = self.position
         size = self._child_size()
 
-        return [(x + size, y), (x, y), (x, y + size), (x + size, y + size)]
-
-    def _update_children_positions(self, position: Tuple[int, int]) -> None:
-        """Set the position of this Block to <position> and update all its
-        descendants to have positions consistent with this Block's.
-
-        <position> is the (row, col) coordinates of the upper-left corner
-         of this Block.
-        """
-        x = position[0]
-        y = position[1]
-        size = self._child_size()
-        if not self.children:
-            self.position = position
-        else:
-            self.position = position
-            self.children[0].position = (x + size, y)
-            self.children[1].position = (x, y)
-            self.children[2].position = (x, y + size)
-            self.children[3].position = (x + size, y + size)
-            # recurse again to update positions for children of children
-            self.children[0]._update_children_positions((x + size, y))
-            self.children[1]._update_children_positions((x, y))
-            self.children[2]._update_children_positions((x, y + size))
-            self.children[3]._update_children_positions((x + size, y + size))
+        return [(x + dx * size, y + dy * size) for dx, dy in _QUADRANT_OFFSETS]
 
     def smashable(self) -> bool:
         """Return True iff this block can be smashed.
@@ -259,14 +648,12 @@ class Block:
 
         Precondition: <direction> is either 0 or 1
         """
-        if self.children:
+        if self._children:
+            c = self.children
             if direction == 0:
-                self.children = [self.children[1], self.children[0],
-                                 self.children[3], self.children[2]]
+                self.children = [c[1], c[0], c[3], c[2]]
             elif direction == 1:
-                self.children = [self.children[3], self.children[2],
-                                 self.children[1], self.children[0]]
-            self._update_children_positions(self.position)
+                self.children = [c[3], c[2], c[1], c[0]]
             return True
         return False
 
@@ -280,18 +667,20 @@ class Block:
 
         Precondition: <direction> is either 1 or 3.
         """
-        if self.children:
+        if self._children:
+            # Rather than reordering every descendant now, record the turns
+            # and apply them one level at a time as the children are visited.
             if direction == 1:
-                self.children = [self.children[1], self.children[2],
-                                 self.children[3], self.children[0]]
+                self._turns = (self._turns + 1) % 4
             elif direction == 3:
-                self.children = [self.children[3], self.children[0],
-                                 self.children[1], self.children[2]]
-            self.children[0].rotate(direction)
-            self.children[1].rotate(direction)
-            self.children[2].rotate(direction)
-            self.children[3].rotate(direction)
-            self._update_children_positions(self.position)
+                self._turns = (self._turns + 3) % 4
+            self._adopt_children()
+            parent = self._parent
+            if parent is not None:
+                # This Block's own stored hashes do not depend on its turns,
+                # but those of its ancestors do.
+                parent._forget_hashes()
+            self._mark_cells()
             return True
         return False
 
@@ -307,63 +696,467 @@ class Block:
         return False
 
     def combine(self) -> bool:
-        """Turn this Block into c1 leaf based on the majority colour of its
+        """Turn this Block into a leaf based on the majority colour of its
         children.
 
         The majority colour is the colour with the most child blocks of that
-        colour. A tie does not constitute c1 majority (e.g., if there are two
+        colour. A tie does not constitute a majority (e.g., if there are two
         red children and two blue children, then there is no majority colour).
 
-        If there is no majority colour, do nothing. If this block is not at c1
+        If there is no majority colour, do nothing. If this block is not at a
         level of max_depth - 1, or this block has no children, do nothing.
 
-        Return True iff this Block was turned into c1 leaf node.
+        Return True iff this Block was turned into a leaf node.
         """
-        #could use dictionary instead of list for list_count
-        level = self.level
-        max_depth = self.max_depth
-        if level == max_depth - 1 and self.children != []:
-            colour = []
-            for child in self.children:
-                colour.append(child.colour)
-            c1 = colour.count(colour[0])
-            c2 = colour.count(colour[1])
-            c3 = colour.count(colour[2])
-            if (c1 == 2 and c2 == 1 and c3 == 2) or \
-                    (c1 == 2 and c2 == 1 and c3 == 1) or \
-                    c1 == 3 or c1 == 4 or (c1 == 2 and c2 == 2 and c3 == 1):
-                self.children = []
-                self.colour = colour[0]
-            elif (c1 == 1 and c2 == 2 and c3 == 2) or \
-                    (c1 == 1 and c2 == 2 and c3 == 1) or c2 == 3:
-                self.children = []
-                self.colour = colour[1]
-            elif c1 == 1 and c2 == 1 and c3 == 2:
-                self.children = []
-                self.colour = colour[2]
-            else:
-                return False
-            return True
-        return False
+        if not self.can_combine():
+            return False
+        colour = self.majority_colour()
+        self.children = []
+        self.colour = colour
+        return True
+
+    def majority_colour(self) -> Optional[Tuple[int, int, int]]:
+        """Return the colour that more of this Block's children have than any
+        other colour, or None if there is no such colour or this Block has no
+        children.
+
+        >>> board = Block((0, 0), 750, None, 0, 1)
+        >>> board.children = [Block((0, 0), 375, colour, 1, 1)
+        ...                   for colour in [(1, 1, 1), (2, 2, 2), (1, 1, 1),
+        ...                                  (3, 3, 3)]]
+        >>> board.majority_colour()
+        (1, 1, 1)
+        """
+        if not self._children:
+            return None
+        colours = [child.colour for child in self._children]
+        counts = [colours.count(colour) for colour in colours]
+        best = max(counts)
+        if counts.count(best) != best:
+            # Another colour has as many children as the most common one.
+            return None
+        return colours[counts.index(best)]
+
+    def can_combine(self) -> bool:
+        """Return True iff combine would turn this Block into a leaf, without
+        changing anything.
+        """
+        return self.level == self.max_depth - 1 and \
+            self.majority_colour() is not None
+
+    def apply_move(self, action: str, direction: Optional[int] = None,
+                   colour: Optional[Tuple[int, int, int]] = None) -> \
+            Optional[MoveUndo]:
+        """Perform <action> on this Block in place, and return a record that
+        can undo it. Return None if the move was not performed.
+
+        <action> and <direction> are as in the moves made by players, and
+        <colour> is the colour used by a paint move.
+
+        Moves must be undone in the reverse of the order they were applied.
+
+        >>> board = generate_board(3, 750)
+        >>> copy = board.create_copy()
+        >>> undo = board.apply_move('rotate', 1)
+        >>> undo.undo()
+        >>> board == copy
+        True
+        """
+        saved = None
+        if action == 'rotate':
+            performed = self.rotate(direction)
+        elif action == 'swap':
+            performed = self.swap(direction)
+        elif action == 'smash':
+            if self._parent is not None:
+                # The turns pending higher up must reach this Block's count
+                # of turns before it is saved.
+                self._settle()
+            saved = (self.colour, self._turns)
+            performed = self.smash()
+        elif action == 'paint':
+            saved = self.colour
+            performed = self.paint(colour)
+        elif action == 'combine':
+            saved = self.children
+            performed = self.combine()
+        else:
+            performed = False
+        if not performed:
+            return None
+        return MoveUndo(self, action, direction, saved)
 
     def create_copy(self) -> Block:
         """Return a new Block that is a deep copy of this Block.
 
         Remember that a deep copy has new blocks (not aliases) at every level.
         """
-        block = Block(self.position, self.size, self.colour,
+        if self._parent is not None:
+            self._settle()
+        block = self._copy_at(self.position)
+        if self._raster is not None and self._parent is None:
+            block._raster = self._raster.copy()
+        return block
+
+    def _copy_at(self, position: Tuple[int, int]) -> Block:
+        """Return a new Block that is a deep copy of this Block, placed at
+        <position>.
+
+        Precondition: none of this Block's ancestors has pending turns.
+        """
+        block = Block(position, self.size, self._colour,
                       self.level, self.max_depth)
-        for child in self.children:
-            block.children.append(child.create_copy())
+        # The hashes are only ever replaced, never changed in place.
+        block._hashes = self._hashes
+        children = self._children
+        if children and self._turns:
+            children = self._ordered_children()
+        if children:
+            x, y = position
+            half = children[0].size
+            # The copies are new, so there is nothing above them to settle
+            # and no raster to mark.
+            copies = (children[0]._copy_at((x + half, y)),
+                      children[1]._copy_at(position),
+                      children[2]._copy_at((x, y + half)),
+                      children[3]._copy_at((x + half, y + half)))
+            block._children = _Children.of(block, copies)
+            block._adopt_children()
         return block
 
+    def __deepcopy__(self, memo: dict) -> Block:
+        """Return a deep copy of this Block, as create_copy does.
+        """
+        return self.create_copy()
+
+    def __reduce__(self) -> Tuple[object, tuple]:
+        """Return how pickle and copy can make a new Block like this one.
+
+        The new Block is the root of a tree of new Blocks, as a Block given by
+        create_copy is.
+        """
+        if self._parent is not None:
+            self._settle()
+        return _build_tree, (self.position, self.level, self.max_depth,
+                             self._describe())
+
+    def _describe(self) -> Tuple[int, Optional[Tuple[int, int, int]], list]:
+        """Return the size and colour of this Block and the descriptions of
+        its children, in order.
+
+        Precondition: none of this Block's ancestors has pending turns.
+        """
+        return self.size, self._colour, [child._describe() for child
+                                         in self._ordered_children()]
+
+
+def _build_tree(position: Tuple[int, int], level: int, max_depth: int,
+                description: Tuple[int, Optional[Tuple[int, int, int]],
+                                   list]) -> Block:
+    """Return a new Block at <position>, at <level> and with <max_depth>, whose
+    size, colour and descendants are given by <description>, as returned by
+    Block._describe.
+    """
+    size, colour, children = description
+    block = Block(position, size, colour, level, max_depth)
+    if children:
+        x, y = position
+        block._children = _Children.of(block, [
+            _build_tree((x + dx * child[0], y + dy * child[0]), level + 1,
+                        max_depth, child)
+            for child, (dx, dy) in zip(children, _QUADRANT_OFFSETS)])
+        block._adopt_children()
+    return block
+
+
+class MoveUndo:
+    """A record of a move performed by Block.apply_move, which can put the
+    Block back the way it was.
+
+    === Public Attributes ===
+    block:
+        The Block the move was performed on.
+    action:
+        The action that was performed.
+    direction:
+        The direction of the move, if it has one.
+    """
+    # === Private Attributes ===
+    # _saved:
+    #   What the move replaced: the colour of a painted Block, the colour and
+    #   pending turns of a smashed Block, or the children of a combined Block.
+    block: Block
+    action: str
+    direction: Optional[int]
+    _saved: Optional[object]
+
+    def __init__(self, block: Block, action: str, direction: Optional[int],
+                 saved: Optional[object]) -> None:
+        """Initialize this record of <action> in <direction> on <block>, with
+        <saved> being the state the move replaced.
+        """
+        self.block = block
+        self.action = action
+        self.direction = direction
+        self._saved = saved
+
+    def undo(self) -> None:
+        """Undo the move in place.
+
+        Precondition: every move performed after this one has been undone.
+        """
+        block = self.block
+        if self.action == 'rotate':
+            block.rotate(4 - self.direction)
+        elif self.action == 'swap':
+            block.swap(self.direction)
+        elif self.action == 'smash':
+            # Discard the randomly generated children.
+            block.children = []
+            block.colour, block._turns = self._saved
+        elif self.action == 'paint':
+            block.colour = self._saved
+        elif self.action == 'combine':
+            # Keep the turns passed on to the leaf since it was combined, as
+            # they still need to be applied to the restored children.
+            block._children = self._saved
+            block._adopt_children()
+            block.colour = None
+
+
+class _Children(list):
+    """The children of a Block, which makes that Block the parent of each child
+    put into them by any of the list methods that change a list.
+
+    A copy of these children, or these children once pickled, is a plain list.
+    """
+    # === Private Attributes ===
+    # _block:
+    #   A weak reference to the Block whose children these are.
+    _block: weakref.ref
+
+    # A Block is made with an empty list of children, so these are made as
+    # often as Blocks are, and are kept as small and quick to make as a list.
+    __slots__ = ('_block',)
+
+    @classmethod
+    def of(cls, block: Block, children: Iterable[Block] = ()) -> _Children:
+        """Return new children of <block> that are <children>, without
+        changing the parents of <children>.
+        """
+        result = cls(children)
+        result._block = weakref.ref(block)
+        return result
+
+    def __reduce__(self) -> Tuple[type, tuple]:
+        """Return how pickle and copy can make a plain list of these children.
+        """
+        return list, (list(self),)
+
+    def _changed(self, was_empty: bool) -> None:
+        """Make their Block the parent of each of these children, and record
+        that its subtree has changed. <was_empty> is whether there were no
+        children before the change.
+        """
+        block = self._block()
+        if block is None or block._children is not self:
+            # These children were replaced, so they no longer belong to it.
+            return
+        if was_empty:
+            # Like setting the children, start the new children unturned.
+            block._turns = 0
+        block._adopt_children()
+        block._changed()
+
+    def append(self, child: Block) -> None:
+        """Append <child> to these children.
+        """
+        was_empty = not self
+        list.append(self, child)
+        self._changed(was_empty)
+
+    def extend(self, children: Iterable[Block]) -> None:
+        """Append each of <children> to these children.
+        """
+        was_empty = not self
+        list.extend(self, children)
+        self._changed(was_empty)
+
+    def __iadd__(self, children: Iterable[Block]) -> _Children:
+        """Append each of <children> to these children.
+        """
+        self.extend(children)
+        return self
+
+    def __imul__(self, times: int) -> _Children:
+        """Repeat these children <times> times.
+        """
+        was_empty = not self
+        list.__imul__(self, times)
+        self._changed(was_empty)
+        return self
+
+    def insert(self, index: int, child: Block) -> None:
+        """Insert <child> before <index>.
+        """
+        was_empty = not self
+        list.insert(self, index, child)
+        self._changed(was_empty)
+
+    def __setitem__(self, index: object, value: object) -> None:
+        """Replace the child or slice of children at <index> with <value>.
+        """
+        was_empty = not self
+        list.__setitem__(self, index, value)
+        self._changed(was_empty)
+
+    def __delitem__(self, index: object) -> None:
+        """Remove the child or slice of children at <index>.
+        """
+        list.__delitem__(self, index)
+        self._changed(False)
+
+    def pop(self, index: int = -1) -> Block:
+        """Remove and return the child at <index>.
+        """
+        child = list.pop(self, index)
+        self._changed(False)
+        return child
+
+    def remove(self, child: Block) -> None:
+        """Remove the first of these children that is equal to <child>.
+        """
+        list.remove(self, child)
+        self._changed(False)
+
+    def clear(self) -> None:
+        """Remove all of these children.
+        """
+        list.clear(self)
+        self._changed(False)
+
+    def reverse(self) -> None:
+        """Reverse the order of these children.
+        """
+        list.reverse(self)
+        self._changed(False)
+
+    def sort(self, *args: object, **kwargs: object) -> None:
+        """Sort these children, as list.sort does.
+        """
+        list.sort(self, *args, **kwargs)
+        self._changed(False)
+
+
+class Raster:
+    """The colour ids of the unit cells of a board, as given by
+    settings.colour_id.
+
+    === Public Attributes ===
+    length:
+        The number of unit cells along each side of the board.
+    cells:
+        The colour id of each unit cell. The columns of the board are stored
+        one after the other, so the unit cell at column i and row j is at
+        index i * length + j.
+    version:
+        The number of times a region of this Raster has been marked as
+        changed. Anything worked out from <cells> is out of date once this
+        has changed.
+
+    === Representation Invariants ===
+    - len(cells) == length * length
+    """
+    # === Private Attributes ===
+    # _marked:
+    #   The (column, row, width) squares of unit cells that have changed on
+    #   the board but not yet in <cells>.
+    # _log:
+    #   The (version, column, row, width) of the most recently marked
+    #   squares, oldest first.
+    length: int
+    cells: bytearray
+    version: int
+    _marked: List[Tuple[int, int, int]]
+    _log: List[Tuple[int, int, int, int]]
+
+    def __init__(self, length: int) -> None:
+        """Initialize this Raster with <length> by <length> unit cells, all
+        with colour id 0.
+        """
+        self.length = length
+        self.cells = bytearray(length * length)
+        self.version = 0
+        self._marked = []
+        self._log = []
+
+    def copy(self) -> Raster:
+        """Return a new Raster with the same cells, version and marked squares
+        as this Raster.
+        """
+        raster = Raster.__new__(Raster)
+        raster.length = self.length
+        raster.cells = bytearray(self.cells)
+        raster.version = self.version
+        raster._marked = list(self._marked)
+        raster._log = list(self._log)
+        return raster
+
+    def fill(self, block: Block, x: int, y: int) -> None:
+        """Write the colour ids of the unit cells of <block> into this Raster,
+        with the upper left unit cell of <block> at column <x> and row <y>.
+        """
+        cells = self.cells
+        length = self.length
+        for colour, dx, dy, width in block.leaf_cells():
+            fill = bytes([colour_id(colour)]) * width
+            start = (x + dx) * length + y + dy
+            for i in range(start, start + width * length, length):
+                cells[i:i + width] = fill
+
+    def mark(self, x: int, y: int, width: int) -> None:
+        """Record that the <width> by <width> square of unit cells whose upper
+        left cell is at column <x> and row <y> has changed.
+        """
+        self.version += 1
+        self._marked.append((x, y, width))
+        self._log.append((self.version, x, y, width))
+        if len(self._log) > _RASTER_LOG_LENGTH:
+            del self._log[0]
+
+    def take_marked(self) -> List[Tuple[int, int, int]]:
+        """Return the marked squares that must be filled in again, largest
+        first and leaving out any square inside another one, and forget them.
+        """
+        marked = sorted(set(self._marked), key=lambda square: -square[2])
+        self._marked = []
+        result = []
+        for x, y, width in marked:
+            if not any(ox <= x and x + width <= ox + owidth and
+                       oy <= y and y + width <= oy + owidth
+                       for ox, oy, owidth in result):
+                result.append((x, y, width))
+        return result
+
+    def regions_changed_since(self, version: int) -> \
+            Optional[List[Tuple[int, int, int]]]:
+        """Return the (column, row, width) squares marked after <version>, or
+        None if this Raster no longer remembers all of them.
+        """
+        if version == self.version:
+            return []
+        if not self._log or self._log[0][0] > version + 1:
+            return None
+        return [(x, y, width) for marked, x, y, width in self._log
+                if marked > version]
+
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
-            'settings'
+            'weakref', 'settings'
         ],
         'max-attributes': 15,
         'max-args': 6
@@ -28,8 +28,9 @@ import pygame
 
 from actions import ACTION_MESSAGE, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE,\
     SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE, ACTION_PENALTY
-from block import Block
-from player import Player
+from block import Block, Raster
+from goal import BlobGoal, BlobIndex, score_goals
+from player import MCTSPlayer, Player, SearchPlayer
 from renderer import Renderer
 from settings import ANIMATION_DURATION
 
@@ -48,13 +49,7 @@ def _block_to_squares(board: Block) -> List[Tuple[Tuple[int, int, int],
 
     The order of the squares does not matter.
     """
-    lst = []
-    if not board.children:
-        return [(board.colour, board.position, board.size)]
-    else:
-        for child in board.children:
-            lst.extend(_block_to_squares(child))
-    return lst
+    return list(board.leaf_squares())
 
 
 class GameData:
@@ -78,12 +73,22 @@ class GameData:
     === Representation Invariants ===
     - len(players) >= 1
     """
+    # === Private Attributes ===
+    # _blobs:
+    #   The blobs of <board>, if any player has a BlobGoal and they have been
+    #   asked for, or None.
+    # _scores:
+    #   The raster of <board> and its version when the players' goal scores
+    #   were last worked out, followed by those scores in the order of
+    #   <players>, or None.
     max_turns: int
     board: Block
     players: List[Player]
     smashes: Dict[int, int]
     combines: Dict[int, int]
     paints: Dict[int, int]
+    _blobs: Optional[BlobIndex]
+    _scores: Optional[Tuple[Raster, int, List[int]]]
 
     def __init__(self, board: Block, players: List[Player]) -> None:
         """Initialize the game data, saving a reference to <board> and
@@ -99,19 +104,23 @@ class GameData:
         self.smashes = {}
         self.combines = {}
         self.paints = {}
+        self._blobs = None
+        self._scores = None
 
         # Start off all counts at 0
         for player in players:
             self.smashes[player.id] = 0
             self.combines[player.id] = 0
             self.paints[player.id] = 0
+            if isinstance(player, (SearchPlayer, MCTSPlayer)):
+                player.goals = [other.goal for other in players]
 
     def calculate_score(self, player_id: int) -> Tuple[int, int]:
         """Return a tuple containing first the <player_id>'s score based on
         their goal in the game and second the deductions from their score based
         on the actions they've taken.
         """
-        goal_score = self.players[player_id].goal.score(self.board)
+        goal_score = self._goal_scores()[player_id]
 
         penalty = self.smashes[player_id] * ACTION_PENALTY[SMASH] + \
                   self.combines[player_id] * ACTION_PENALTY[COMBINE] + \
@@ -119,6 +128,25 @@ class GameData:
 
         return goal_score, penalty
 
+    def _goal_scores(self) -> List[int]:
+        """Return the score of each player's goal on the board, in the order
+        of <players>.
+
+        All the goals are scored together, and the scores are kept until the
+        board changes.
+        """
+        raster = self.board.raster()
+        if self._scores is not None and self._scores[0] is raster and \
+                self._scores[1] == raster.version:
+            return self._scores[2]
+        goals = [player.goal for player in self.players]
+        if any(isinstance(goal, BlobGoal) for goal in goals) and \
+                (self._blobs is None or self._blobs.board is not self.board):
+            self._blobs = BlobIndex(self.board)
+        scores = score_goals(self.board, goals, self._blobs)
+        self._scores = (raster, raster.version, scores)
+        return scores
+
 
 class GameState:
     """One of the different states that a Blocky game can be in.
@@ -371,7 +399,7 @@ if __name__ == '__main__':
         'allowed-io': ['run_game'],
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'pygame', '__future__',
-            'block', 'player', 'renderer', 'settings', 'actions'
+            'block', 'goal', 'player', 'renderer', 'settings', 'actions'
         ],
         'generated-members': 'pygame.*'
     })
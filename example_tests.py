@@ -23,17 +23,30 @@ This file contains some sample tests for Assignment 2.
 Please use this as a starting point to check your work and write your own
 tests!
 """
-from typing import List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+import copy
 import os
+import pickle
+import random
 import pygame
 import pytest
 
-from block import Block
-from blocky import _block_to_squares
-from goal import BlobGoal, PerimeterGoal, _flatten
-from player import _get_block
+from actions import ACTION_PENALTY, ROTATE_CLOCKWISE, SMASH
+from bitboard import Bitboard, score_moves
+from block import Block, generate_board
+from blocky import GameData, _block_to_squares
+from goal import BlobGoal, BlobIndex, PerimeterGoal, _flatten, ScoreCache, \
+    SCORE_CACHE, _SCORE_ENTRY_BYTES, _leaf_blobs, score_goals
+from linear_board import LinearBoard, from_block, generate_linear_board, \
+    _INTERNAL
+from moves import decode_move, encode, encode_move
+import persistent_block
+from player import MCTSPlayer, PrunedMoves, RandomPlayer, SearchPlayer, \
+    SmartPlayer, _generate_moves, _get_block, _get_blocks, _list_valid_moves
 from renderer import Renderer
-from settings import COLOUR_LIST
+from settings import COLOUR_LIST, MAX_COLOUR_IDS, colour_id
+import settings
 
 
 def set_children(block: Block, colours: List[Optional[Tuple[int, int, int]]]) \
@@ -55,6 +68,18 @@ def set_children(block: Block, colours: List[Optional[Tuple[int, int, int]]]) \
         block.children.append(b)
 
 
+def copy_after_move(board: Block, move: Tuple[str, Optional[int], Block],
+                    colour: Tuple[int, int, int]) -> Optional[Block]:
+    """Return a copy of <board> after making <move> on it, painting with
+    <colour>, or None if the move can't be made.
+    """
+    copy = board.create_copy()
+    action, direction, block = decode_move(encode_move(move), copy)
+    if block.apply_move(action, direction, colour) is None:
+        return None
+    return copy
+
+
 @pytest.fixture
 def renderer() -> Renderer:
     os.environ['SDL_VIDEODRIVER'] = 'dummy'
@@ -124,6 +149,18 @@ def board_16x16_rotate1() -> Block:
     return board
 
 
+@pytest.fixture
+def no_score_cache() -> Iterator[None]:
+    """Turn off the cache of scores shared by every Goal for a test, so that
+    every score is worked out.
+    """
+    max_bytes = SCORE_CACHE.max_bytes
+    SCORE_CACHE.clear()
+    SCORE_CACHE.resize(0)
+    yield
+    SCORE_CACHE.resize(max_bytes)
+
+
 @pytest.fixture
 def flattened_board_16x16() -> List[List[Tuple[int, int, int]]]:
     """Create a list of the unit cells inside the reference board."""
@@ -257,6 +294,196 @@ class TestBlock:
         board_16x16.children[0].rotate(1)
         assert board_16x16 == board_16x16_rotate1
 
+    def test_positions_follow_ancestors(self, board_16x16) -> None:
+        """Test that a block's position reflects swaps and rotations of its
+        ancestors, even when it was looked up before those moves.
+        """
+        block = board_16x16.children[0].children[3]
+        assert block.position == (563, 188)
+
+        board_16x16.swap(0)
+        assert block.position == (188, 188)
+
+        board_16x16.rotate(3)
+        assert block.position == (188, 375)
+        assert board_16x16.children[2].children[0] is block
+
+    def test_set_position(self, board_16x16) -> None:
+        """Test that moving the root of a tree moves its descendants, and that
+        no other block can be moved on its own.
+        """
+        board_16x16.position = (10, 20)
+        assert board_16x16.children[2].position == (10, 395)
+        with pytest.raises(ValueError):
+            board_16x16.children[2].position = (0, 0)
+
+    def test_smashed_positions(self) -> None:
+        """Test that the children of a smashed block are placed by their own
+        size, as smash made them.
+        """
+        random.seed(148)
+        board = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+        board.smash()
+        board.children[0].smash()
+        corner = board.children[0].children[0]
+        assert corner.size == 187
+        assert corner.position == (562, 0)
+        assert (corner.colour, (562, 0), 187) in _block_to_squares(board)
+        assert _get_block(board, (562, 0), 2) is corner
+        assert _get_blocks(board, [(562, 0)], 2) == [corner]
+
+    def test_deepcopy_and_pickle(self, board_16x16) -> None:
+        """Test that copy.deepcopy and pickle give new trees equal to the
+        original.
+        """
+        board_16x16.children[0].rotate(1)
+        for other in [copy.deepcopy(board_16x16),
+                      pickle.loads(pickle.dumps(board_16x16)),
+                      copy.copy(board_16x16)]:
+            assert other == board_16x16
+            assert other.children[0] is not board_16x16.children[0]
+            assert other.children[0].children[1].path() == [0, 1]
+            other.children[0].children[1].paint(COLOUR_LIST[3])
+            assert other != board_16x16
+
+    def test_list_methods_adopt_children(self, board_16x16,
+                                         board_16x16_swap0) -> None:
+        """Test that changing the list of children of a block in place keeps
+        its structural hash and the children's parent up to date.
+        """
+        assert board_16x16.structural_hash() != \
+            board_16x16_swap0.structural_hash()
+        children = board_16x16.children
+        first = children.pop(0)
+        children.insert(1, first)
+        children[2:] = [children[3], children[2]]
+        assert board_16x16 == board_16x16_swap0
+        assert first.path() == [1]
+        assert board_16x16.children[1].children[2].position == \
+            board_16x16_swap0.children[1].children[2].position
+
+    def test_held_block_after_ancestor_rotation(self, board_16x16,
+                                                board_16x16_rotate1) -> None:
+        """Test that a block looked up before its parent was rotated sees its
+        children in their rotated order.
+        """
+        corner = board_16x16.children[0]
+        board_16x16.rotate(1)
+
+        expected = board_16x16_rotate1.children[0].children
+        assert [child.colour for child in corner.children] == \
+            [child.colour for child in expected]
+        assert board_16x16.children[3] is corner
+
+    def test_held_block_after_ancestor_rotation_and_hash(self,
+                                                         board_16x16) -> None:
+        """Test that hashing a board does not keep a block looked up before
+        the board was rotated from seeing its children in their rotated order.
+        """
+        copy = board_16x16.create_copy()
+        corner = board_16x16.children[0]
+        board_16x16.rotate(1)
+        board_16x16.structural_hash()
+        corner.swap(0)
+
+        copy.rotate(1)
+        copy.children[3].swap(0)
+        assert board_16x16 == copy
+
+    def test_apply_and_undo_moves(self, board_16x16) -> None:
+        """Test that moves applied through the move journal can be undone in
+        reverse order, restoring the original board.
+        """
+        original = board_16x16.create_copy()
+        corner = board_16x16.children[0]
+        undos = [board_16x16.children[1].apply_move('smash'),
+                 corner.apply_move('combine'),
+                 board_16x16.apply_move('rotate', 3),
+                 board_16x16.apply_move('swap', 1)]
+        assert None not in undos
+        assert corner.colour == COLOUR_LIST[1]
+
+        for undo in reversed(undos):
+            undo.undo()
+        assert board_16x16 == original
+        assert board_16x16.children[0] is corner
+
+    def test_undo_smash_after_ancestor_rotation(self, board_16x16) -> None:
+        """Test that undoing a smash of a combined block made after its parent
+        was rotated gives back the children the combine took, in order.
+        """
+        original = board_16x16.create_copy()
+        corner = board_16x16.children[0]
+        undos = [corner.apply_move('combine'),
+                 board_16x16.apply_move('rotate', 1),
+                 corner.apply_move('smash')]
+        assert None not in undos
+
+        for undo in reversed(undos):
+            undo.undo()
+        assert board_16x16 == original
+
+    def test_structural_hash(self, board_16x16, board_16x16_swap0) -> None:
+        """Test that the structural hash follows moves on the board and agrees
+        with equality.
+        """
+        start = board_16x16.structural_hash()
+        assert board_16x16.create_copy().structural_hash() == start
+
+        board_16x16.swap(0)
+        assert board_16x16.structural_hash() == \
+            board_16x16_swap0.structural_hash()
+        assert board_16x16.structural_hash() != start
+
+        board_16x16.swap(0)
+        board_16x16.children[0].rotate(1)
+        assert board_16x16.structural_hash() != start
+        for _ in range(3):
+            board_16x16.children[0].rotate(1)
+        assert board_16x16.structural_hash() == start
+
+    def test_colour_ids_fit_in_a_byte(self, monkeypatch) -> None:
+        """Test that colour ids are given out until they no longer fit in the
+        byte each unit cell of a raster has.
+        """
+        monkeypatch.setattr(settings, '_COLOUR_IDS', {})
+        for i in range(MAX_COLOUR_IDS):
+            assert colour_id((i, 0, 0)) == i
+        assert colour_id((5, 0, 0)) == 5
+        with pytest.raises(ValueError):
+            colour_id((0, 0, 1))
+
+    def test_raster_follows_moves(self, board_16x16,
+                                  board_16x16_swap0) -> None:
+        """Test that the raster kept by a board is updated in place by moves,
+        one changed square at a time.
+        """
+        raster = board_16x16.raster()
+        version = raster.version
+        leaf = board_16x16.children[0].children[3]
+        colour = leaf.colour
+
+        leaf.paint(COLOUR_LIST[2])
+        assert raster.regions_changed_since(version) == [(3, 1, 1)]
+        assert board_16x16.raster() is raster
+        assert raster.cells[3 * 4 + 1] == colour_id(COLOUR_LIST[2])
+
+        leaf.paint(colour)
+        board_16x16.swap(0)
+        assert raster.version == version + 3
+        assert board_16x16.raster().cells == board_16x16_swap0.raster().cells
+
+    def test_raster_marks_rotated_block(self, board_16x16,
+                                        board_16x16_rotate1) -> None:
+        """Test that rotating a block marks only the square of that block.
+        """
+        raster = board_16x16.raster()
+        version = raster.version
+        board_16x16.children[0].rotate(1)
+        assert raster.regions_changed_since(version) == [(2, 0, 2)]
+        assert board_16x16.raster().cells == board_16x16_rotate1.raster().cells
+        assert board_16x16 == board_16x16_rotate1
+
 
 class TestPlayer:
     """A collection of methods for testing the methods and functions in the
@@ -283,6 +510,261 @@ class TestPlayer:
         assert _get_block(board_16x16, top_right, 2) == \
             board_16x16.children[0].children[0]
 
+    def test_get_blocks(self, board_16x16) -> None:
+        """Test that looking up many locations at once finds the same blocks
+        as looking each one up, including locations off the board.
+        """
+        size = board_16x16.size
+        locations = [(x, y) for x in range(-1, size + 1, 61)
+                     for y in range(-1, size + 1, 59)] + [(size, 0), (0, size)]
+        for level in range(3):
+            expected = [_get_block(board_16x16, location, level)
+                        for location in locations]
+            actual = _get_blocks(board_16x16, locations, level)
+            assert all(block1 is block2
+                       for block1, block2 in zip(expected, actual))
+        assert _get_blocks(board_16x16, [(size, 0), (size - 1, 0)], 2) == \
+            [None, board_16x16.children[0].children[0]]
+
+    def test_smart_player_best_move(self, board_16x16) -> None:
+        """Test that a SmartPlayer picks the best scoring of the moves it
+        looks at, on a block of the board it was given, without changing that
+        board.
+        """
+        copy = board_16x16.create_copy()
+        goal = BlobGoal(COLOUR_LIST[3])
+        player = SmartPlayer(0, goal, 100)
+        player._proceed = True
+        action, direction, block = player.generate_move(board_16x16)
+
+        assert board_16x16 == copy
+        target = board_16x16
+        for index in block.path():
+            target = target.children[index]
+        assert target is block
+        if action == 'smash':
+            # A smash gives random children, so it can't be made again here.
+            return
+        best = copy_after_move(board_16x16, (action, direction, block),
+                               goal.colour)
+        for move in _list_valid_moves(goal.colour, copy):
+            if move[0] != 'smash':
+                other = copy_after_move(copy, move, goal.colour)
+                assert goal.score(other) <= goal.score(best)
+
+    def test_search_player(self, board_16x16) -> None:
+        """Test that a SearchPlayer looking one turn ahead makes the move with
+        the best score after penalties, and learns the other players' goals
+        from the game.
+        """
+        # Smashes are scored by random outcomes, which could beat the others.
+        random.seed(1)
+        copy = board_16x16.create_copy()
+        goal = BlobGoal(COLOUR_LIST[3])
+        player = SearchPlayer(0, goal, 1, time_limit=None)
+        other = RandomPlayer(1, PerimeterGoal(COLOUR_LIST[0]))
+        GameData(board_16x16, [player, other])
+        assert player.goals == [goal, other.goal]
+
+        player._proceed = True
+        action, direction, block = player.generate_move(board_16x16)
+        assert board_16x16 == copy
+        assert block is decode_move(encode_move((action, direction, block)),
+                                    board_16x16)[2]
+        assert action != 'smash'
+        best = copy_after_move(board_16x16, (action, direction, block),
+                               goal.colour)
+        value = goal.score(best) - ACTION_PENALTY[(action, direction)]
+        for move in _list_valid_moves(goal.colour, copy):
+            if move[0] != 'smash':
+                after = copy_after_move(copy, move, goal.colour)
+                assert goal.score(after) - ACTION_PENALTY[move[:2]] <= value
+        assert player.nodes > 0
+
+        # With a budget of one board, only passing is known to be valid.
+        player = SearchPlayer(0, goal, 2, max_nodes=1)
+        player._proceed = True
+        assert player.generate_move(board_16x16)[:2] == ('pass', None)
+
+    def test_search_player_depth(self) -> None:
+        """Test that a SearchPlayer looking two turns ahead makes a valid move
+        without changing the board, after searching past smashes.
+        """
+        random.seed(19)
+        board = generate_board(3, 512)
+        copy = board.create_copy()
+        goal = PerimeterGoal(random.choice(COLOUR_LIST))
+        player = SearchPlayer(0, goal, 2, time_limit=None)
+        random.seed(133)
+        player._proceed = True
+        move = player.generate_move(board)
+        assert board == copy
+        assert move in _list_valid_moves(goal.colour, board) or \
+            move[:2] == ('pass', None)
+
+    def test_mcts_player(self, board_16x16) -> None:
+        """Test that an MCTSPlayer makes a valid move on the board it was
+        given without changing it, and keeps the tree below that move.
+        """
+        copy = board_16x16.create_copy()
+        goal = BlobGoal(COLOUR_LIST[3])
+        player = MCTSPlayer(0, goal, time_limit=None, max_playouts=200)
+        player._proceed = True
+        action, direction, block = player.generate_move(board_16x16)
+        assert board_16x16 == copy
+        assert player.playouts == 200
+        assert player.playouts_per_second > 0
+        assert block is decode_move(encode_move((action, direction, block)),
+                                    board_16x16)[2]
+        if action != 'pass':
+            assert block.apply_move(action, direction, goal.colour)
+
+        # This player is the only one, so it moves again from the board its
+        # move gave, unless the move was a smash with other children.
+        kept = player._root
+        assert kept.visits > 0
+        if action != 'smash':
+            assert player._find_root(board_16x16.structural_hash(), 0) is kept
+
+    def test_mcts_player_tries_every_move(self, board_16x16) -> None:
+        """Test that an MCTSPlayer tries every valid move from a node, even
+        those that leave its score unchanged for now.
+        """
+        goal = PerimeterGoal(COLOUR_LIST[0])
+        player = MCTSPlayer(0, goal, time_limit=None, max_playouts=1)
+        player._proceed = True
+        player.generate_move(board_16x16)
+        moves = player._moves(board_16x16, player._root, False)
+        expected = {encode_move(move) for move in
+                    _generate_moves(goal.colour, board_16x16)}
+        assert set(moves) == expected | {encode(('pass', None), [])}
+
+    def test_smart_player_pool(self) -> None:
+        """Test that a SmartPlayer with a process pool scores its moves just
+        as one without a pool does, smashes included.
+        """
+        random.seed(2)
+        board = generate_board(4, 750)
+        goal = BlobGoal(COLOUR_LIST[1])
+        moves = _list_valid_moves(goal.colour, board)
+        assert len(moves) > 32
+        state = random.getstate()
+        expected = SmartPlayer(0, goal, 0)._score_moves(board, moves)
+        with ProcessPoolExecutor(2) as pool:
+            random.setstate(state)
+            actual = SmartPlayer(0, goal, 0, pool)._score_moves(board, moves)
+        assert actual == expected
+
+    def test_smart_player_time_limit(self, board_16x16) -> None:
+        """Test that a SmartPlayer with a time limit scores no more than
+        <difficulty> moves, and every move it considers if it has the time.
+        """
+        copy = board_16x16.create_copy()
+        goal = BlobGoal(COLOUR_LIST[3])
+        player = SmartPlayer(0, goal, 3, time_limit=10000)
+        player._proceed = True
+        action, direction, block = player.generate_move(board_16x16)
+        assert board_16x16 == copy
+        assert player.candidates_examined == 3
+        # The moves on the root are scored first.
+        assert block is board_16x16 or action == 'pass'
+
+        player = SmartPlayer(0, goal, 1000, time_limit=10000)
+        player._proceed = True
+        player.generate_move(board_16x16)
+        assert player.candidates_examined == \
+            len(_list_valid_moves(goal.colour, board_16x16))
+
+        player = SmartPlayer(0, goal, 1000, time_limit=10000, prune=True)
+        player._proceed = True
+        player.generate_move(board_16x16)
+        assert player.candidates_examined == \
+            len(list(PrunedMoves(goal, board_16x16)))
+
+    def test_generate_moves(self, board_16x16) -> None:
+        """Test that the generated moves are the valid moves, each once, and
+        that the filters only drop moves.
+        """
+        colour = COLOUR_LIST[0]
+        moves = list(_generate_moves(colour, board_16x16))
+        keys = [(move[0], move[1], tuple(move[2].path())) for move in moves]
+        assert len(keys) == len(set(keys))
+        for move in moves:
+            assert copy_after_move(board_16x16, move, colour) is not None
+        assert board_16x16.children[0].can_combine()
+        assert not board_16x16.can_combine()
+
+        rotations = list(_generate_moves(colour, board_16x16,
+                                         [ROTATE_CLOCKWISE], [1]))
+        assert [move[2] for move in rotations] == board_16x16.children[:1]
+        assert all(move in moves for move in rotations)
+
+        by_level = list(_generate_moves(colour, board_16x16, by_level=True))
+        assert len(by_level) == len(moves)
+        assert all(move in moves for move in by_level)
+        levels = [move[2].level for move in by_level]
+        assert levels == sorted(levels)
+
+    def test_move_codes(self, board_16x16) -> None:
+        """Test that every valid move has its own code, and that a code finds
+        the same move on a copy of the board.
+        """
+        copy = board_16x16.create_copy()
+        moves = _list_valid_moves(COLOUR_LIST[0], board_16x16)
+        codes = [encode_move(move) for move in moves]
+        assert len(set(codes)) == len(codes)
+        for move, code in zip(moves, codes):
+            action, direction, block = decode_move(code, copy)
+            assert (action, direction) == move[:2]
+            assert block.path() == move[2].path()
+            assert block == move[2]
+        # The children of a leaf can't be found.
+        assert decode_move(encode(SMASH, [1, 0]), copy) is None
+
+    def test_pruned_moves(self, board_16x16) -> None:
+        """Test that pruning keeps a move for every board the valid moves
+        give, and counts the moves it leaves out.
+        """
+        goal = BlobGoal(COLOUR_LIST[3])
+        set_children(board_16x16.children[0], [COLOUR_LIST[1]] * 4)
+        copy = board_16x16.create_copy()
+        version = board_16x16.raster().version
+        moves = _list_valid_moves(goal.colour, board_16x16)
+        pruned = PrunedMoves(goal, board_16x16)
+        kept = list(pruned)
+        assert board_16x16 == copy
+        assert board_16x16.raster().version == version
+        assert pruned.pruned == len(moves) - len(kept)
+        # Swapping or rotating children[0] leaves the board the same, so only
+        # the first of those four moves is kept.
+        child_moves = [move[:2] for move in kept
+                       if move[2] is board_16x16.children[0]]
+        assert child_moves == [('rotate', 3), ('combine', None)]
+
+        boards = set()
+        for move in moves:
+            if move[0] != 'smash':
+                after = copy_after_move(copy, move, goal.colour)
+                boards.add(after.structural_hash())
+        assert len(boards) == len([move for move in kept
+                                   if move[0] != 'smash'])
+
+        # Under a PerimeterGoal, the moves on the lower right child of the
+        # upper left quadrant of a depth 3 board are all left out.
+        board = Block((0, 0), 750, None, 0, 3)
+        set_children(board, [COLOUR_LIST[0], None, COLOUR_LIST[0],
+                             COLOUR_LIST[0]])
+        set_children(board.children[1], [COLOUR_LIST[1], COLOUR_LIST[1],
+                                          COLOUR_LIST[1], None])
+        inner = board.children[1].children[3]
+        set_children(inner, [COLOUR_LIST[2], COLOUR_LIST[1], COLOUR_LIST[2],
+                             COLOUR_LIST[3]])
+        goal = PerimeterGoal(COLOUR_LIST[2])
+        kept = list(PrunedMoves(goal, board))
+        assert all(move[2] is not block for move in kept
+                   for block in [inner] + inner.children)
+        assert any(move[2] is board.children[1] for move in kept)
+
 
 class TestGoal:
     """A collection of methods for testing the sub-classes of Goal.
@@ -315,6 +797,137 @@ class TestGoal:
             goal = BlobGoal(colour)
             assert goal.score(board_16x16) == expected
 
+    def test_blob_goal_large_blob(self) -> None:
+        """Test that a blob with far more unit cells than the recursion limit
+        can be scored.
+        """
+        board = Block((0, 0), 512, COLOUR_LIST[0], 0, 8)
+        assert BlobGoal(COLOUR_LIST[0]).score(board) == 4 ** 8
+        assert BlobGoal(COLOUR_LIST[1]).score(board) == 0
+
+        cells = _flatten(board)
+        visited = [[-1] * len(cells) for _ in cells]
+        goal = BlobGoal(COLOUR_LIST[0])
+        assert goal._undiscovered_blob_size((0, 0), cells, visited) == 4 ** 8
+
+    def test_leaf_blobs_match_unit_cells(self) -> None:
+        """Test that scoring blobs on the leaves of random boards agrees with
+        scoring them on the unit cells.
+        """
+        random.seed(11)
+        for depth in range(1, 7):
+            board = generate_board(depth, 512)
+            result = _leaf_blobs(board)
+            cells = _flatten(board)
+            for colour in COLOUR_LIST:
+                goal = BlobGoal(colour)
+                visited = [[-1] * len(cells) for _ in cells]
+                expected = max(
+                    goal._undiscovered_blob_size((x, y), cells, visited)
+                    for x in range(len(cells)) for y in range(len(cells)))
+                assert result.get(colour, 0) == expected
+
+    def test_blob_goal_follows_moves(self, board_16x16) -> None:
+        """Test that a BlobGoal scoring the same board again and again keeps
+        up with the moves made on it.
+        """
+        goal = BlobGoal(COLOUR_LIST[3])
+        assert goal.score(board_16x16) == 5
+        assert goal.score(board_16x16) == 5
+
+        board_16x16.children[0].children[2].paint(COLOUR_LIST[3])
+        assert goal.score(board_16x16) == 6
+        board_16x16.swap(0)
+        assert goal.score(board_16x16) == 6
+        board_16x16.children[2].colour = COLOUR_LIST[0]
+        assert goal.score(board_16x16) == 2
+
+    def test_score_delta(self, board_16x16, board_16x16_swap0) -> None:
+        """Test that the score change of a move can be found without changing
+        the board.
+        """
+        copy = board_16x16.create_copy()
+        interior = board_16x16.children[0].children[2]
+        perimeter = PerimeterGoal(COLOUR_LIST[3])
+        blob = BlobGoal(COLOUR_LIST[3])
+
+        assert perimeter.score_delta(board_16x16, ('paint', None,
+                                                   interior)) == 0
+        assert blob.score_delta(board_16x16, ('paint', None, interior)) == 1
+        for goal in [perimeter, blob]:
+            assert goal.score_delta(board_16x16, ('swap', 0, board_16x16)) \
+                == goal.score(board_16x16_swap0) - goal.score(board_16x16)
+            assert goal.score_delta(board_16x16, ('smash', None,
+                                                  interior)) == 0
+        assert board_16x16 == copy
+
+    def test_score_goals(self, board_16x16, no_score_cache) -> None:
+        """Test that scoring many goals together, directly or through the game
+        data, gives the same scores as scoring them one at a time.
+        """
+        goals = [BlobGoal(colour) for colour in COLOUR_LIST] + \
+            [PerimeterGoal(colour) for colour in COLOUR_LIST]
+        expected = [goal.score(board_16x16) for goal in goals]
+        assert score_goals(board_16x16, goals) == expected
+
+        players = [RandomPlayer(i, goal) for i, goal in enumerate(goals)]
+        data = GameData(board_16x16, players)
+        assert [data.calculate_score(i)[0] for i in range(len(goals))] == \
+            expected
+
+        board_16x16.children[0].children[2].paint(COLOUR_LIST[3])
+        expected = [goal.score(board_16x16) for goal in goals]
+        assert [data.calculate_score(i)[0] for i in range(len(goals))] == \
+            expected
+
+    def test_blob_index(self, board_16x16) -> None:
+        """Test that a BlobIndex follows the moves made on its board and
+        their undoing.
+        """
+        index = BlobIndex(board_16x16)
+        for action, direction, block in _list_valid_moves(COLOUR_LIST[0],
+                                                          board_16x16):
+            undo = block.apply_move(action, direction, COLOUR_LIST[0])
+            expected = _leaf_blobs(board_16x16)
+            for colour in COLOUR_LIST:
+                assert index.largest(colour) == expected.get(colour, 0)
+            undo.undo()
+        expected = _leaf_blobs(board_16x16)
+        for colour in COLOUR_LIST:
+            assert index.largest(colour) == expected.get(colour, 0)
+
+    def test_score_cache(self, board_16x16, board_16x16_swap0) -> None:
+        """Test that a ScoreCache finds boards by their unit cells and drops
+        the least recently used scores.
+        """
+        # Room for two scores of a board with 16 unit cells.
+        cache = ScoreCache(2 * (_SCORE_ENTRY_BYTES + 16))
+        goal = BlobGoal(COLOUR_LIST[3])
+        assert cache.lookup(goal, board_16x16) is None
+
+        cache.store(goal, board_16x16, 5)
+        cache.store(goal, board_16x16_swap0, 6)
+        assert cache.lookup(goal, board_16x16.create_copy()) == 5
+        assert cache.lookup(PerimeterGoal(COLOUR_LIST[3]), board_16x16) is None
+
+        board_16x16.swap(0)
+        cache.store(PerimeterGoal(COLOUR_LIST[3]), board_16x16, 5)
+        assert len(cache) == 2
+        assert cache.lookup(goal, board_16x16_swap0) is None
+        assert cache.lookup(goal, board_16x16.create_copy()) is None
+        assert (cache.hits, cache.misses) == (1, 4)
+
+        cache.resize(0)
+        assert len(cache) == 0
+
+        # Boards with the same unit cells share their scores.
+        cache.resize(2 * (_SCORE_ENTRY_BYTES + 16))
+        leaf = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+        split = Block((0, 0), 750, None, 0, 2)
+        set_children(split, [COLOUR_LIST[0]] * 4)
+        cache.store(goal, leaf, 16)
+        assert cache.lookup(goal, split) == 16
+
     def test_perimeter_goal(self, board_16x16):
         correct_scores = [
             (COLOUR_LIST[0], 2),
@@ -328,6 +941,187 @@ class TestGoal:
             goal = PerimeterGoal(colour)
             assert goal.score(board_16x16) == expected
 
+    def test_perimeter_goal_deep_board(self) -> None:
+        """Test that the perimeter score of a deep random board counts the
+        same cells as its flattened list does.
+        """
+        random.seed(7)
+        board = generate_board(5, 512)
+        cells = _flatten(board)
+        for colour in COLOUR_LIST:
+            expected = cells[0].count(colour) + cells[-1].count(colour) + \
+                [column[0] for column in cells].count(colour) + \
+                [column[-1] for column in cells].count(colour)
+            assert PerimeterGoal(colour).score(board) == expected
+
+
+class TestLinearBoard:
+    """A collection of methods for testing the LinearBoard class against the
+    Block class.
+    """
+    def test_generate_matches_block(self) -> None:
+        """Test that, given the same random state, a generated LinearBoard
+        describes the same board as a generated Block.
+        """
+        random.seed(148)
+        board = generate_board(4, 512)
+        random.seed(148)
+        linear = generate_linear_board(4, 512)
+
+        assert linear.to_block() == board
+        assert from_block(board) == linear
+
+    def test_odd_size_round_trip(self) -> None:
+        """Test that a LinearBoard of an odd-sized board sizes its children
+        the way smash does.
+        """
+        random.seed(148)
+        board = generate_board(3, 375)
+        assert from_block(board).to_block() == board
+
+    def test_palette_limit(self) -> None:
+        """Test that a colour that has no buffer value left is refused rather
+        than taken for a node that is not a leaf.
+        """
+        linear = LinearBoard(1, 750, COLOUR_LIST[0])
+        assert linear.smash(0, 0)
+        for i in range(_INTERNAL - len(linear.palette)):
+            assert linear.paint(1, 0, (i, 0, 1))
+        with pytest.raises(ValueError):
+            linear.paint(1, 0, (0, 0, 2))
+        assert linear.is_leaf(1, 0)
+        assert linear.colour(1, 0) == (_INTERNAL - len(COLOUR_LIST) - 1, 0, 1)
+
+    def test_swap0(self, board_16x16, board_16x16_swap0) -> None:
+        """Test that the linear reference board can be swapped along the
+        horizontal plane.
+        """
+        linear = from_block(board_16x16)
+        assert linear.swap(0, 0, 0)
+        assert linear == from_block(board_16x16_swap0)
+
+    def test_rotate1(self, board_16x16, board_16x16_rotate1) -> None:
+        """Test that the top-right block of the linear reference board can be
+        rotated clockwise.
+        """
+        linear = from_block(board_16x16)
+        assert linear.rotate(1, 0, 1)
+        assert linear == from_block(board_16x16_rotate1)
+
+    def test_combine_and_copy(self, board_16x16) -> None:
+        """Test that combine follows Block.combine, and that a copy is not
+        affected by changes to the original.
+        """
+        linear = from_block(board_16x16)
+        copy = linear.create_copy()
+
+        assert linear.combine(1, 0) == board_16x16.children[0].combine()
+        assert linear.to_block() == board_16x16
+        assert copy != linear
+
+
+class TestPersistentBlock:
+    """A collection of methods for testing the PersistentBlock class against
+    the Block class.
+    """
+    def test_moves_match_block(self) -> None:
+        """Test that a sequence of moves on a PersistentBlock gives the same
+        boards and scores as on a Block, and leaves every earlier board as it
+        was.
+        """
+        random.seed(7)
+        board = generate_board(4, 750)
+        versions = [(persistent_block.from_block(board), board.create_copy())]
+        goals = [BlobGoal(COLOUR_LIST[2]), PerimeterGoal(COLOUR_LIST[2])]
+        for _ in range(40):
+            colour = random.choice(COLOUR_LIST)
+            move = random.choice(_list_valid_moves(colour, board))
+            state = random.getstate()
+            block = decode_move(encode_move(move), board)[2]
+            block.apply_move(move[0], move[1], colour)
+            random.setstate(state)
+            after = versions[-1][0].apply_move(encode_move(move), colour)
+            assert after.to_block() == board
+            for goal in goals:
+                assert goal.score(after) == goal.score(board)
+            versions.append((after, board.create_copy()))
+        for persistent, expected in versions:
+            assert persistent.to_block() == expected
+
+    def test_shares_untouched_subtrees(self, board_16x16) -> None:
+        """Test that a move only makes new Blocks on the path to the moved
+        Block, and that invalid moves give no board.
+        """
+        board = persistent_block.from_block(board_16x16)
+        code = encode(('paint', None), [0, 3])
+        after = board.apply_move(code, COLOUR_LIST[0])
+        assert after.children[0] is not board.children[0]
+        for i in [1, 2, 3]:
+            assert after.children[i] is board.children[i]
+            assert after.children[0].children[i - 1] is \
+                board.children[0].children[i - 1]
+
+        assert board.apply_move(code, board.children[0].children[3].colour) \
+            is None
+        assert board.apply_move(encode(('rotate', 1), [1])) is None
+        assert board.apply_move(encode(('smash', None), [0, 3])) is None
+
+
+class TestBitboard:
+    """A collection of methods for testing the Bitboard view of a board.
+    """
+    def test_reference_board(self, board_16x16) -> None:
+        """Test that the reference board's bitboard has the right cells and
+        scores.
+        """
+        bitboard = Bitboard(board_16x16)
+        # Column 0 is the upper-left then lower-left child on level 1.
+        assert bitboard.plane(COLOUR_LIST[2]) & 0b1111 == 0b0011
+        assert bitboard.plane(COLOUR_LIST[1]) & 0b1111 == 0b1100
+        for colour in COLOUR_LIST:
+            assert bitboard.perimeter_score(colour) == \
+                PerimeterGoal(colour).score(board_16x16)
+            assert bitboard.blob_score(colour) == \
+                BlobGoal(colour).score(board_16x16)
+
+    def test_random_boards(self) -> None:
+        """Test that bitboard scores agree with the goals on random boards.
+        """
+        random.seed(15)
+        for depth in range(1, 7):
+            board = generate_board(depth, 512)
+            bitboard = Bitboard(board)
+            for colour in COLOUR_LIST:
+                assert bitboard.perimeter_score(colour) == \
+                    PerimeterGoal(colour).score(board)
+                assert bitboard.blob_score(colour) == \
+                    BlobGoal(colour).score(board)
+
+    def test_score_moves(self, board_16x16) -> None:
+        """Test that scoring a batch of moves gives the same scores as making
+        each move on its own copy of the board, and leaves the board alone.
+        """
+        copy = board_16x16.create_copy()
+        moves = [('rotate', 1, board_16x16), ('swap', 0, board_16x16),
+                 ('swap', 1, board_16x16.children[0]),
+                 ('paint', None, board_16x16.children[0].children[2]),
+                 ('combine', None, board_16x16.children[0]),
+                 ('smash', None, board_16x16.children[0].children[1])]
+        for goal in [BlobGoal(COLOUR_LIST[3]), PerimeterGoal(COLOUR_LIST[1])]:
+            expected = []
+            for move in moves:
+                board = copy_after_move(board_16x16, move, goal.colour)
+                expected.append(goal.score(board or board_16x16))
+            assert score_moves(board_16x16, goal, moves) == expected
+
+        # Another player's paint uses that player's colour.
+        goal = BlobGoal(COLOUR_LIST[3])
+        paint = moves[3]
+        board = copy_after_move(board_16x16, paint, COLOUR_LIST[0])
+        assert score_moves(board_16x16, goal, [paint], COLOUR_LIST[0]) == \
+            [goal.score(board)]
+        assert board_16x16 == copy
+
 
 if __name__ == '__main__':
     pytest.main(['example_tests.py'])
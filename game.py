@@ -56,7 +56,7 @@ class Game:
         """Initialize this game, as described in the Assignment 2 handout.
 
         Precondition:
-            2 <= max_depth <= 5
+            2 <= max_depth and 2 ** max_depth <= BOARD_SIZE
         """
         board = generate_board(max_depth, BOARD_SIZE)
         players = create_players(num_human, num_random, smart_players)
@@ -22,10 +22,11 @@ Misha Schwartz, and Jaisie Sin
 This file contains the hierarchy of Goal classes.
 """
 from __future__ import annotations
+from collections import OrderedDict
 import random
-from typing import List, Tuple
-from block import Block
-from settings import COLOUR_LIST
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Type
+from block import Block, Raster
+from settings import COLOUR_LIST, SCORE_CACHE_BYTES, colour_id
 
 
 def generate_goals(num_goals: int) -> List[Goal]:
@@ -82,11 +83,400 @@ def _flatten(block: Block) -> List[List[Tuple[int, int, int]]]:
     L[0][0] represents the unit cell in the upper left corner of the Block.
     """
     length = 2 ** (block.max_depth - block.level)
-    list_flatten = [[unit_cell_colour(block, row, col) for col in range(length)]
-                    for row in range(length)]
+    list_flatten = [[None] * length for _ in range(length)]
+    # fill the whole square of each leaf at once, a column slice at a time
+    for colour, x, y, width in block.leaf_cells():
+        fill = [colour] * width
+        for column in list_flatten[x:x + width]:
+            column[y:y + width] = fill
     return list_flatten
 
 
+def _perimeter_counts(block: Block, x: int = 0, y: int = 0,
+                      length: Optional[int] = None) -> \
+        Dict[Tuple[int, int, int], int]:
+    """Return how many unit cells of each colour in <block> are on the
+    perimeter of a board with <length> unit cells along each side, where the
+    upper left unit cell of <block> is at column <x> and row <y> of the board.
+    Corner cells are counted twice.
+
+    By default, <block> is the whole board.
+
+    Only the Blocks that touch an edge of the board are visited, and each leaf
+    among them adds its width in unit cells once for every edge it touches.
+    """
+    counts = {}
+    width = 2 ** (block.max_depth - block.level)
+    if length is None:
+        length = width
+    stack = [(block, x, y, width)]
+    while stack:
+        node, x, y, width = stack.pop()
+        children = node.children
+        if not children:
+            edges = (x == 0) + (y == 0) + (x + width == length) + \
+                (y + width == length)
+            counts[node.colour] = counts.get(node.colour, 0) + edges * width
+            continue
+        half = width // 2
+        # children in order: upper-right, upper-left, lower-left, lower-right
+        for child, cx, cy in ((children[0], x + half, y),
+                              (children[1], x, y),
+                              (children[2], x, y + half),
+                              (children[3], x + half, y + half)):
+            if cx == 0 or cy == 0 or cx + half == length or \
+                    cy + half == length:
+                stack.append((child, cx, cy, half))
+    return counts
+
+
+# The approximate number of bytes used by each score kept in a ScoreCache, not
+# counting the unit cells in its key: the rest of the key tuple, the score,
+# and the cache's bookkeeping for the entry.
+_SCORE_ENTRY_BYTES = 256
+
+
+class ScoreCache:
+    """A bounded cache of goal scores, keyed by the unit cells of a board and
+    the type and colour of a goal. When the cache is full, the score that was
+    used least recently is dropped.
+
+    === Public Attributes ===
+    max_bytes:
+        The most bytes of memory, about, that this cache uses.
+    hits:
+        The number of times a score was found in this cache.
+    misses:
+        The number of times a score was looked for but not found.
+
+    === Representation Invariants ===
+    - max_bytes >= 0
+    """
+    # === Private Attributes ===
+    # _scores:
+    #   The cached scores, from least to most recently used.
+    # _bytes:
+    #   The number of bytes of memory, about, used by the scores in <_scores>.
+    max_bytes: int
+    hits: int
+    misses: int
+    _scores: OrderedDict[Tuple[bytes, Type[Goal], Tuple[int, int, int]], int]
+    _bytes: int
+
+    def __init__(self, max_bytes: int = SCORE_CACHE_BYTES) -> None:
+        """Initialize this cache to use about <max_bytes> bytes of memory at
+        most. A cache with <max_bytes> of 0 keeps nothing.
+        """
+        self.max_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+        self._bytes = 0
+        self.resize(max_bytes)
+
+    def __len__(self) -> int:
+        """Return the number of scores in this cache.
+        """
+        return len(self._scores)
+
+    def resize(self, max_bytes: int) -> None:
+        """Limit this cache to about <max_bytes> bytes of memory, dropping the
+        least recently used scores if there are now too many.
+        """
+        self.max_bytes = max(0, max_bytes)
+        self._shrink()
+
+    def _shrink(self) -> None:
+        """Drop the least recently used scores until this cache is within
+        <max_bytes>.
+        """
+        while self._bytes > self.max_bytes:
+            key, _ = self._scores.popitem(last=False)
+            self._bytes -= _SCORE_ENTRY_BYTES + len(key[0])
+
+    def clear(self) -> None:
+        """Drop every score in this cache and reset its counters.
+        """
+        self._scores.clear()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, goal: Goal, board: Block) -> Optional[int]:
+        """Return the cached score of <goal> on <board>, or None if it isn't
+        in this cache.
+        """
+        if not self.max_bytes:
+            return None
+        key = _score_key(goal, board)
+        score = self._scores.get(key)
+        if score is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._scores.move_to_end(key)
+        return score
+
+    def store(self, goal: Goal, board: Block, score: int) -> None:
+        """Remember that <goal> scores <score> on <board>.
+        """
+        if not self.max_bytes:
+            return
+        key = _score_key(goal, board)
+        if key not in self._scores:
+            self._bytes += _SCORE_ENTRY_BYTES + len(key[0])
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        self._shrink()
+
+
+def _score_key(goal: Goal, board: Block) -> Tuple[bytes, Type[Goal],
+                                                  Tuple[int, int, int]]:
+    """Return the key of the score of <goal> on <board> in a ScoreCache.
+
+    A goal's score only depends on the colours of the unit cells of the board,
+    so the key holds all of them rather than a hash of the board, which two
+    different boards could share.
+    """
+    return bytes(board.raster().cells), type(goal), goal.colour
+
+
+def _find(parent: List[int], item: int) -> int:
+    """Return the representative of <item> in the union-find forest <parent>,
+    halving the path to it along the way.
+    """
+    while parent[item] != item:
+        parent[item] = parent[parent[item]]
+        item = parent[item]
+    return item
+
+
+def _leaf_blobs(block: Block) -> Dict[Tuple[int, int, int], int]:
+    """Return the number of unit cells in the largest blob of each colour in
+    <block>, working on its leaves rather than its unit cells.
+
+    Each leaf is one connected square, so leaves are joined with union-find
+    wherever two leaves of the same colour share part of an edge. The edges
+    are found by following each boundary between neighbouring Blocks down to
+    the leaves on either side of it, so the work grows with the number of
+    leaves and the length of the boundaries between them, not the number of
+    unit cells.
+    """
+    # The children of every Block, and the leaf number of every leaf, by id.
+    children_of = {}
+    indices = {}
+    parent = []
+    sizes = []
+    colours = []
+    # Pairs of Blocks that meet along an edge: (left, right, True) or
+    # (top, bottom, False).
+    edges = []
+    stack = [block]
+    while stack:
+        node = stack.pop()
+        children = node.children
+        children_of[id(node)] = children
+        if not children:
+            indices[id(node)] = len(parent)
+            parent.append(len(parent))
+            width = 2 ** (node.max_depth - node.level)
+            sizes.append(width * width)
+            colours.append(node.colour)
+        else:
+            upper_right, upper_left, lower_left, lower_right = children
+            edges.append((upper_left, upper_right, True))
+            edges.append((lower_left, lower_right, True))
+            edges.append((upper_left, lower_left, False))
+            edges.append((upper_right, lower_right, False))
+            stack.extend(children)
+    while edges:
+        first, second, across = edges.pop()
+        first_children = children_of[id(first)]
+        second_children = children_of[id(second)]
+        if first_children or second_children:
+            # Split the edge in half, taking the children of each Block that
+            # lie along it: the right side of <first> and the left side of
+            # <second>, or the bottom of <first> and the top of <second>.
+            if not first_children:
+                first_a = first_b = first
+            elif across:
+                first_a, first_b = first_children[0], first_children[3]
+            else:
+                first_a, first_b = first_children[2], first_children[3]
+            if not second_children:
+                second_a = second_b = second
+            elif across:
+                second_a, second_b = second_children[1], second_children[2]
+            else:
+                second_a, second_b = second_children[1], second_children[0]
+            edges.append((first_a, second_a, across))
+            edges.append((first_b, second_b, across))
+        elif colours[indices[id(first)]] == colours[indices[id(second)]]:
+            a = _find(parent, indices[id(first)])
+            b = _find(parent, indices[id(second)])
+            if a != b:
+                if sizes[a] < sizes[b]:
+                    a, b = b, a
+                parent[b] = a
+                sizes[a] += sizes[b]
+    largest = {}
+    for leaf, colour in enumerate(colours):
+        if parent[leaf] == leaf and sizes[leaf] > largest.get(colour, 0):
+            largest[colour] = sizes[leaf]
+    return largest
+
+
+class BlobIndex:
+    """The blobs of every colour on a board, kept up to date as moves are made
+    on the board by labelling again only the unit cells around each move.
+
+    === Public Attributes ===
+    board:
+        The board whose blobs are indexed.
+    """
+    # === Private Attributes ===
+    # _raster:
+    #   The raster of the board when it was last labelled.
+    # _version:
+    #   The version of the board's raster that this index agrees with.
+    # _length:
+    #   The number of unit cells along each side of the board.
+    # _labels:
+    #   The label of the blob each unit cell is in, laid out like
+    #   Raster.cells.
+    # _members:
+    #   The unit cells of each blob, by label.
+    # _blob_colours:
+    #   The colour id of each blob, by label.
+    # _by_colour:
+    #   The labels of the blobs of each colour id.
+    # _next_label:
+    #   The label to give the next new blob.
+    board: Block
+    _raster: Raster
+    _version: int
+    _length: int
+    _labels: List[int]
+    _members: Dict[int, List[int]]
+    _blob_colours: Dict[int, int]
+    _by_colour: Dict[int, Set[int]]
+    _next_label: int
+
+    def __init__(self, board: Block) -> None:
+        """Initialize this index with the blobs of <board>.
+        """
+        self.board = board
+        self._reset(board.raster())
+
+    def _reset(self, raster: Raster) -> None:
+        """Label every unit cell of the board from scratch, using its
+        <raster>.
+        """
+        self._raster = raster
+        self._length = raster.length
+        self._labels = [-1] * len(raster.cells)
+        self._members = {}
+        self._blob_colours = {}
+        self._by_colour = {}
+        self._next_label = 0
+        self._relabel(raster.cells, range(len(raster.cells)))
+        self._version = raster.version
+
+    def largest(self, colour: Tuple[int, int, int]) -> int:
+        """Return the number of unit cells in the largest blob of <colour> on
+        the board as it is now.
+        """
+        raster = self.board.raster()
+        if raster is not self._raster:
+            self._reset(raster)
+        elif raster.version != self._version:
+            regions = raster.regions_changed_since(self._version)
+            if regions is None:
+                self._reset(raster)
+            else:
+                length = self._length
+                changed = set()
+                for x, y, width in regions:
+                    for column in range(x, x + width):
+                        start = column * length + y
+                        changed.update(range(start, start + width))
+                self._relabel(raster.cells, changed)
+                self._version = raster.version
+        labels = self._by_colour.get(colour_id(colour))
+        if not labels:
+            return 0
+        return max(len(self._members[label]) for label in labels)
+
+    def _relabel(self, cells: bytes, changed: Iterable[int]) -> None:
+        """Bring the labels up to date with <cells>, where only the unit cells
+        in <changed> may have changed colour.
+
+        A blob with a changed cell may have been split, so all of its cells
+        are labelled again. Any other blob can only have been joined to the
+        changed cells, so it keeps its label and takes in the new cells and
+        any other blobs they connect it to.
+        """
+        labels = self._labels
+        members = self._members
+        length = self._length
+        todo = set(changed)
+        for label in {labels[cell] for cell in todo}:
+            if label in members:
+                todo.update(members.pop(label))
+                self._by_colour[self._blob_colours.pop(label)].discard(label)
+        for cell in todo:
+            labels[cell] = -1
+        for start in todo:
+            if labels[start] != -1:
+                continue
+            ident = cells[start]
+            labels[start] = -2
+            blob = [start]
+            touching = set()
+            i = 0
+            while i < len(blob):
+                cell = blob[i]
+                i += 1
+                row = cell % length
+                for other in (cell - length, cell + length,
+                              cell - 1 if row else -1,
+                              cell + 1 if row != length - 1 else -1):
+                    if 0 <= other < len(labels) and cells[other] == ident:
+                        if labels[other] == -1:
+                            labels[other] = -2
+                            blob.append(other)
+                        elif labels[other] >= 0:
+                            touching.add(labels[other])
+            self._add_blob(ident, blob, touching)
+
+    def _add_blob(self, ident: int, blob: List[int],
+                  touching: Set[int]) -> None:
+        """Label the unit cells in <blob>, which have colour id <ident>, as one
+        blob together with the blobs in <touching>.
+        """
+        labels = self._labels
+        members = self._members
+        if touching:
+            # Keep the largest label, and move everything else into it.
+            label = max(touching, key=lambda other: len(members[other]))
+            for other in touching:
+                if other != label:
+                    blob.extend(members.pop(other))
+                    self._by_colour[ident].discard(other)
+                    del self._blob_colours[other]
+            for cell in blob:
+                labels[cell] = label
+            members[label].extend(blob)
+        else:
+            label = self._next_label
+            self._next_label += 1
+            for cell in blob:
+                labels[cell] = label
+            members[label] = blob
+            self._blob_colours[label] = ident
+            self._by_colour.setdefault(ident, set()).add(label)
+
+
 class Goal:
     """A player goal in the game of Blocky.
 
@@ -116,6 +506,24 @@ class Goal:
         """
         raise NotImplementedError
 
+    def score_delta(self, board: Block,
+                    move: Tuple[str, Optional[int], Block]) -> int:
+        """Return how much the score for this goal on <board> would change if
+        <move> were made, where <move> is a move made by a player on a Block
+        of <board>. A paint move uses the colour of this goal. Return 0 if the
+        move can't be made.
+
+        The move is made and then undone, so <board> ends up as it was.
+        """
+        action, direction, block = move
+        before = self.score(board)
+        undo = block.apply_move(action, direction, self.colour)
+        if undo is None:
+            return 0
+        after = self.score(board)
+        undo.undo()
+        return after - before
+
 
 class PerimeterGoal(Goal):
     """ The class for PerimeterGoal
@@ -125,20 +533,36 @@ class PerimeterGoal(Goal):
         unit cells of colour c that are on the perimeter(corner cells count
         twice towards the score.
         """
-        acc = 0
-        board_flatten = _flatten(board)
-        board_len = len(board_flatten)
-        for row in range(board_len):
-            if board_flatten[row][0] == self.colour:
-                acc += 1
-            if board_flatten[row][-1] == self.colour:
-                acc += 1
-        for col in range(board_len):
-            if board_flatten[0][col] == self.colour:
-                acc += 1
-            if board_flatten[-1][col] == self.colour:
-                acc += 1
-        return acc
+        score = SCORE_CACHE.lookup(self, board)
+        if score is None:
+            score = _perimeter_counts(board).get(self.colour, 0)
+            SCORE_CACHE.store(self, board, score)
+        return score
+
+    def score_delta(self, board: Block,
+                    move: Tuple[str, Optional[int], Block]) -> int:
+        """Return how much the score for this goal on <board> would change if
+        <move> were made, where <move> is a move made by a player on a Block
+        of <board>. A paint move uses the colour of this goal. Return 0 if the
+        move can't be made.
+
+        A move only changes the unit cells of the Block it is made on, so a
+        Block that doesn't touch the edge of the board can't change the score,
+        and otherwise only the perimeter cells of that Block are counted.
+        """
+        action, direction, block = move
+        x, y, width = block.cell_region()
+        length = 2 ** (board.max_depth - board.level)
+        if x != 0 and y != 0 and x + width != length and \
+                y + width != length:
+            return 0
+        before = _perimeter_counts(block, x, y, length).get(self.colour, 0)
+        undo = block.apply_move(action, direction, self.colour)
+        if undo is None:
+            return 0
+        after = _perimeter_counts(block, x, y, length).get(self.colour, 0)
+        undo.undo()
+        return after - before
 
     def description(self) -> str:
         """Return a description of PerimeterGoal"""
@@ -151,18 +575,15 @@ class BlobGoal(Goal):
     def score(self, board: Block) -> int:
         """Return the total score of BlobGoal. The score is the number of
         connected unit cells of colour c in the largest blob.
+
+        A board that is scored again and again, like the one the game is
+        played on, is better scored with a BlobIndex kept by its owner.
         """
-        acc = 0
-        board_flatten = _flatten(board)
-        visited = [[-1 for _ in range(2**board.max_depth)] \
-                   for _ in range(2**board.max_depth)]
-        for row in range(len(visited)):
-            for col in range(len(visited[0])):
-                if visited[row][col] == -1:
-                    temp = self._undiscovered_blob_size((row, col),
-                                                        board_flatten, visited)
-                    acc = max(acc, temp)
-        return acc
+        score = SCORE_CACHE.lookup(self, board)
+        if score is None:
+            score = _leaf_blobs(board).get(self.colour, 0)
+            SCORE_CACHE.store(self, board, score)
+        return score
 
     def _undiscovered_blob_size(self, pos: Tuple[int, int],
                                 board: List[List[Tuple[int, int, int]]],
@@ -184,22 +605,21 @@ class BlobGoal(Goal):
         Update <visited> so that all cells that are visited are marked with
         either 0 or 1.
         """
-        x = pos[0]
-        y = pos[1]
-        acc = 1
+        acc = 0
         board_len = len(board)
-        if (x < 0 or board_len <= x) or (y < 0 or len(board[0]) <= y):
-            return 0
-        elif board[x][y] != self.colour:
-            visited[x][y] = 0
-            return 0
-        elif visited[x][y] != -1:
-            return 0
-        visited[x][y] = 1
-        acc += self._undiscovered_blob_size((x, y - 1), board, visited)
-        acc += self._undiscovered_blob_size((x, y + 1), board, visited)
-        acc += self._undiscovered_blob_size((x - 1, y), board, visited)
-        acc += self._undiscovered_blob_size((x + 1, y), board, visited)
+        stack = [pos]
+        while stack:
+            x, y = stack.pop()
+            if (x < 0 or board_len <= x) or (y < 0 or len(board[0]) <= y):
+                continue
+            elif board[x][y] != self.colour:
+                visited[x][y] = 0
+                continue
+            elif visited[x][y] != -1:
+                continue
+            visited[x][y] = 1
+            acc += 1
+            stack.extend([(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)])
         return acc
 
     def description(self) -> str:
@@ -207,13 +627,52 @@ class BlobGoal(Goal):
         return 'BlobGoal: Connected Cell: 1 pt (corners excluded).'
 
 
+def score_goals(board: Block, goals: List[Goal],
+                blobs: Optional[BlobIndex] = None) -> List[int]:
+    """Return the score of each of <goals> on <board>, in the same order.
+
+    The perimeter of <board> is walked once for all the PerimeterGoals, and
+    its blobs are found once for all the BlobGoals, using <blobs> if it is
+    given.
+
+    Precondition: <blobs> is None or an index of <board>
+    """
+    perimeter = None
+    largest = None
+    scores = []
+    for goal in goals:
+        score = SCORE_CACHE.lookup(goal, board)
+        if score is not None:
+            scores.append(score)
+            continue
+        if isinstance(goal, PerimeterGoal):
+            if perimeter is None:
+                perimeter = _perimeter_counts(board)
+            scores.append(perimeter.get(goal.colour, 0))
+        elif isinstance(goal, BlobGoal) and blobs is not None:
+            scores.append(blobs.largest(goal.colour))
+        elif isinstance(goal, BlobGoal):
+            if largest is None:
+                largest = _leaf_blobs(board)
+            scores.append(largest.get(goal.colour, 0))
+        else:
+            scores.append(goal.score(board))
+        SCORE_CACHE.store(goal, board, scores[-1])
+    return scores
+
+
+# The cache of scores shared by every Goal. It keeps nothing until it is given
+# some memory, by SCORE_CACHE_BYTES in settings or by resizing it.
+SCORE_CACHE = ScoreCache()
+
+
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'block', 'settings',
-            'math', '__future__'
+            'math', '__future__', 'collections'
         ],
         'max-attributes': 15
     })
@@ -0,0 +1,386 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the LinearBoard class, an array-backed alternative to the
+object-per-node Block tree.
+
+A LinearBoard stores every possible node of a board with a given max_depth in
+one flat buffer. The nodes of each level are laid out one after the other, and
+within a level a node's index is its quadrant path from the root read as a
+base-4 number, using the same child order as Block (0 = upper-right,
+1 = upper-left, 2 = lower-left, 3 = lower-right). The children of the node at
+(level, index) are therefore at (level + 1, 4 * index + i) for i in 0..3, and
+the descendants of a node on any deeper level occupy one contiguous run.
+"""
+from __future__ import annotations
+from typing import Dict, Iterator, List, Optional, Tuple
+import random
+import math
+
+from block import Block
+from settings import COLOUR_LIST
+
+# Buffer values that are not colour ids.
+_INTERNAL = 254
+_ABSENT = 255
+
+# Cache of the index permutations used by rotate, keyed by
+# (number of levels below the rotated node, quarter turns clockwise).
+_ROTATIONS: Dict[Tuple[int, int], List[int]] = {}
+
+
+def _level_offset(level: int) -> int:
+    """Return the buffer index of the first node on <level>.
+    """
+    return (4 ** level - 1) // 3
+
+
+def _rotation(depth: int, turns: int) -> List[int]:
+    """Return the permutation that rotates a run of 4 ** <depth> nodes, all
+    <depth> levels below a common ancestor, by <turns> quarter turns clockwise.
+
+    Entry j of the result is the index, within the run, of the node that ends
+    up at index j.
+    """
+    key = (depth, turns)
+    if key not in _ROTATIONS:
+        perm = []
+        for j in range(4 ** depth):
+            src = 0
+            for k in range(depth):
+                digit = (j >> (2 * k)) & 3
+                src |= ((digit + turns) % 4) << (2 * k)
+            perm.append(src)
+        _ROTATIONS[key] = perm
+    return _ROTATIONS[key]
+
+
+def generate_linear_board(max_depth: int, size: int) -> LinearBoard:
+    """Return a new game board with a depth of <max_depth> and dimensions of
+    <size> by <size>.
+
+    Given the same random state, this produces the same board as
+    block.generate_board.
+
+    >>> board = generate_linear_board(3, 750)
+    >>> board.max_depth
+    3
+    >>> board.is_leaf(0, 0)
+    False
+    """
+    board = LinearBoard(max_depth, size, random.choice(COLOUR_LIST))
+    board.smash(0, 0)
+    return board
+
+
+def from_block(block: Block) -> LinearBoard:
+    """Return a LinearBoard equivalent to the tree rooted at <block>.
+
+    <block> is treated as the root of the new board, so the board's max_depth
+    is <block>.max_depth - <block>.level.
+    """
+    board = LinearBoard(block.max_depth - block.level, block.size,
+                        COLOUR_LIST[0], block.position)
+    nodes = board._nodes
+    stack = [(block, 0, 0)]
+    while stack:
+        node, level, index = stack.pop()
+        if node.children:
+            nodes[_level_offset(level) + index] = _INTERNAL
+            for i in range(4):
+                stack.append((node.children[i], level + 1, 4 * index + i))
+        else:
+            nodes[_level_offset(level) + index] = board._colour_id(node.colour)
+    return board
+
+
+class LinearBoard:
+    """A Blocky board stored as a linear quadtree.
+
+    Nodes are addressed by (level, index), where index is the node's quadrant
+    path from the root read as a base-4 number. The root is (0, 0).
+
+    === Public Attributes ===
+    max_depth:
+        The deepest level allowed on this board.
+    size:
+        The height and width of this board in pixels.
+    position:
+        The (row, col) coordinates of the upper left corner of this board.
+    palette:
+        The colours used on this board. Leaves store an index into this list.
+
+    === Representation Invariants ===
+    - Every node on a level below a leaf is absent.
+    - Every node below an internal node is present.
+    - The root is always present.
+    """
+    # === Private Attributes ===
+    # _nodes:
+    #   One byte per possible node: a colour id for a leaf, _INTERNAL for a
+    #   node with children, or _ABSENT for a node that is not in the tree.
+    max_depth: int
+    size: int
+    position: Tuple[int, int]
+    palette: List[Tuple[int, int, int]]
+    _nodes: bytearray
+
+    def __init__(self, max_depth: int, size: int,
+                 colour: Tuple[int, int, int],
+                 position: Tuple[int, int] = (0, 0)) -> None:
+        """Initialize this board as a single leaf of the given <colour>.
+
+        Preconditions:
+            - max_depth >= 0
+            - size > 0
+        """
+        self.max_depth = max_depth
+        self.size = size
+        self.position = position
+        self.palette = list(COLOUR_LIST)
+        self._nodes = bytearray([_ABSENT]) * _level_offset(max_depth + 1)
+        self._nodes[0] = self._colour_id(colour)
+
+    def __eq__(self, other: LinearBoard) -> bool:
+        """Return True iff this board and <other> describe the same board.
+        """
+        if self.max_depth != other.max_depth or self.size != other.size or \
+                self.position != other.position:
+            return False
+        if self.palette == other.palette:
+            return self._nodes == other._nodes
+        return self.to_block() == other.to_block()
+
+    def _colour_id(self, colour: Tuple[int, int, int]) -> int:
+        """Return the palette index of <colour>, adding it if necessary.
+
+        Raise a ValueError if <colour> is not in the palette and there is no
+        buffer value left below _INTERNAL to give it.
+        """
+        if colour not in self.palette:
+            if len(self.palette) == _INTERNAL:
+                raise ValueError(f'no more than {_INTERNAL} colours can be '
+                                 f'on a LinearBoard')
+            self.palette.append(colour)
+        return self.palette.index(colour)
+
+    def _get(self, level: int, index: int) -> int:
+        """Return the buffer value of the node at (<level>, <index>).
+        """
+        return self._nodes[_level_offset(level) + index]
+
+    def _set(self, level: int, index: int, value: int) -> None:
+        """Set the buffer value of the node at (<level>, <index>).
+        """
+        self._nodes[_level_offset(level) + index] = value
+
+    def _clear_below(self, level: int, index: int) -> None:
+        """Mark every descendant of the node at (<level>, <index>) absent.
+        """
+        nodes = self._nodes
+        for depth in range(1, self.max_depth - level + 1):
+            run = 4 ** depth
+            start = _level_offset(level + depth) + index * run
+            nodes[start:start + run] = bytes([_ABSENT]) * run
+
+    def is_present(self, level: int, index: int) -> bool:
+        """Return True iff the node at (<level>, <index>) is in the tree.
+        """
+        return self._get(level, index) != _ABSENT
+
+    def is_leaf(self, level: int, index: int) -> bool:
+        """Return True iff the node at (<level>, <index>) is a leaf.
+        """
+        return self._get(level, index) < _INTERNAL
+
+    def colour(self, level: int, index: int) -> \
+            Optional[Tuple[int, int, int]]:
+        """Return the colour of the leaf at (<level>, <index>), or None if that
+        node has children or is not in the tree.
+        """
+        value = self._get(level, index)
+        if value >= _INTERNAL:
+            return None
+        return self.palette[value]
+
+    def leaves(self) -> Iterator[Tuple[int, int, Tuple[int, int, int]]]:
+        """Yield (level, index, colour) for every leaf of this board.
+        """
+        stack = [(0, 0)]
+        while stack:
+            level, index = stack.pop()
+            value = self._get(level, index)
+            if value == _INTERNAL:
+                for i in range(3, -1, -1):
+                    stack.append((level + 1, 4 * index + i))
+            else:
+                yield level, index, self.palette[value]
+
+    def smashable(self, level: int, index: int) -> bool:
+        """Return True iff the node at (<level>, <index>) can be smashed.
+        """
+        return level != self.max_depth and self.is_present(level, index) and \
+            self.is_leaf(level, index)
+
+    def smash(self, level: int, index: int) -> bool:
+        """Sub-divide the node at (<level>, <index>) into four randomly
+        generated children, exactly as Block.smash does.
+
+        Return True iff the smash was performed.
+        """
+        if not self.smashable(level, index):
+            return False
+        num = math.exp(-0.25 * level)
+        self._set(level, index, _INTERNAL)
+        first = 4 * index
+        for i in range(4):
+            self._set(level + 1, first + i,
+                      self._colour_id(random.choice(COLOUR_LIST)))
+        for i in range(4):
+            rng = random.random()
+            if rng < num:
+                self.smash(level + 1, first + i)
+        return True
+
+    def swap(self, level: int, index: int, direction: int) -> bool:
+        """Swap the children of the node at (<level>, <index>). If <direction>
+        is 1, swap vertically. If <direction> is 0, swap horizontally.
+
+        Return True iff the swap was performed.
+
+        Precondition: <direction> is either 0 or 1
+        """
+        if self._get(level, index) != _INTERNAL:
+            return False
+        if direction == 0:
+            pairs = [(0, 1), (2, 3)]
+        else:
+            pairs = [(0, 3), (1, 2)]
+        nodes = self._nodes
+        for depth in range(1, self.max_depth - level + 1):
+            run = 4 ** (depth - 1)
+            start = _level_offset(level + depth) + index * 4 * run
+            for a, b in pairs:
+                sa = start + a * run
+                sb = start + b * run
+                nodes[sa:sa + run], nodes[sb:sb + run] = \
+                    nodes[sb:sb + run], nodes[sa:sa + run]
+        return True
+
+    def rotate(self, level: int, index: int, direction: int) -> bool:
+        """Rotate the node at (<level>, <index>) and all its descendants. If
+        <direction> is 1, rotate clockwise. If <direction> is 3, rotate
+        counter-clockwise.
+
+        Return True iff the rotate was performed.
+
+        Precondition: <direction> is either 1 or 3.
+        """
+        if self._get(level, index) != _INTERNAL:
+            return False
+        turns = 1 if direction == 1 else 3
+        nodes = self._nodes
+        for depth in range(1, self.max_depth - level + 1):
+            run = 4 ** depth
+            start = _level_offset(level + depth) + index * run
+            old = nodes[start:start + run]
+            nodes[start:start + run] = \
+                bytes(map(old.__getitem__, _rotation(depth, turns)))
+        return True
+
+    def paint(self, level: int, index: int,
+              colour: Tuple[int, int, int]) -> bool:
+        """Change the colour of the node at (<level>, <index>) iff it is a leaf
+        at max_depth and its colour is different from <colour>.
+
+        Return True iff the colour was changed.
+        """
+        if level != self.max_depth or not self.is_present(level, index):
+            return False
+        colour_id = self._colour_id(colour)
+        if self._get(level, index) == colour_id:
+            return False
+        self._set(level, index, colour_id)
+        return True
+
+    def combine(self, level: int, index: int) -> bool:
+        """Turn the node at (<level>, <index>) into a leaf of the majority
+        colour of its children, exactly as Block.combine does.
+
+        Return True iff the node was turned into a leaf.
+        """
+        if level != self.max_depth - 1 or \
+                self._get(level, index) != _INTERNAL:
+            return False
+        start = _level_offset(level + 1) + 4 * index
+        colours = list(self._nodes[start:start + 4])
+        counts = [colours.count(c) for c in colours]
+        best = max(counts)
+        if counts.count(best) != best:
+            # Another colour has as many children as the most common one.
+            return False
+        self._set(level, index, colours[counts.index(best)])
+        self._clear_below(level, index)
+        return True
+
+    def create_copy(self) -> LinearBoard:
+        """Return a new LinearBoard that is a copy of this board.
+        """
+        board = LinearBoard.__new__(LinearBoard)
+        board.max_depth = self.max_depth
+        board.size = self.size
+        board.position = self.position
+        board.palette = list(self.palette)
+        board._nodes = bytearray(self._nodes)
+        return board
+
+    def to_block(self) -> Block:
+        """Return a new Block tree equivalent to this board.
+        """
+        root = Block(self.position, self.size, self.colour(0, 0), 0,
+                     self.max_depth)
+        stack = [(root, 0)]
+        while stack:
+            block, index = stack.pop()
+            if self._get(block.level, index) != _INTERNAL:
+                continue
+            size = block.size // 2
+            positions = block._children_positions()
+            for i in range(4):
+                child_index = 4 * index + i
+                child = Block(positions[i], size,
+                              self.colour(block.level + 1, child_index),
+                              block.level + 1, self.max_depth)
+                block.children.append(child)
+                stack.append((child, child_index))
+        return root
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
+            'block', 'settings'
+        ],
+        'max-attributes': 15,
+        'max-args': 6
+    })
@@ -0,0 +1,140 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains functions that encode a move as a single int.
+
+A move made by a Player is an (action, direction, block) tuple that refers to
+one Block of one tree. Its code instead holds the action and the path of
+child indices from the root of the board to the Block, so it can be hashed,
+stored, or made on any copy of the board.
+
+The bits of a code, from the lowest, are:
+    - 3 bits for the index of the action in ACTIONS,
+    - 5 bits for the length of the path,
+    - 2 bits for each child index of the path, the first one lowest.
+"""
+from typing import List, Optional, Tuple
+
+from actions import ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
+    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, COMBINE, PAINT, PASS
+from block import Block
+
+# The actions that can be encoded, in the order of their codes.
+ACTIONS = [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, SWAP_HORIZONTAL,
+           SWAP_VERTICAL, SMASH, COMBINE, PAINT, PASS]
+
+_ACTION_BITS = 3
+_LENGTH_BITS = 5
+_PATH_SHIFT = _ACTION_BITS + _LENGTH_BITS
+
+
+def encode(action: Tuple[str, Optional[int]], path: List[int]) -> int:
+    """Return the code of <action> on the Block reached by following <path>
+    from the root of a board.
+
+    >>> encode(SWAP_VERTICAL, [])
+    3
+    >>> encode(PAINT, [2, 1])
+    1558
+
+    Preconditions:
+        - <action> is in ACTIONS
+        - len(path) < 32
+    """
+    code = 0
+    for index in reversed(path):
+        code = (code << 2) | index
+    return (code << _PATH_SHIFT) | (len(path) << _ACTION_BITS) | \
+        ACTIONS.index(action)
+
+
+def decode(code: int) -> Tuple[Tuple[str, Optional[int]], List[int]]:
+    """Return the action and path of <code>.
+
+    >>> decode(1558)
+    (('paint', None), [2, 1])
+    """
+    action = ACTIONS[code & ((1 << _ACTION_BITS) - 1)]
+    length = (code >> _ACTION_BITS) & ((1 << _LENGTH_BITS) - 1)
+    path = []
+    code >>= _PATH_SHIFT
+    for _ in range(length):
+        path.append(code & 3)
+        code >>= 2
+    return action, path
+
+
+def encode_move(move: Tuple[str, Optional[int], Block]) -> int:
+    """Return the code of <move>.
+
+    >>> board = Block((0, 0), 750, None, 0, 2)
+    >>> board.smash()
+    True
+    >>> decode(encode_move(('rotate', 1, board.children[3])))
+    (('rotate', 1), [3])
+    """
+    action, direction, block = move
+    return encode((action, direction), block.path())
+
+
+def find_block(board: Block, path: List[int]) -> Optional[Block]:
+    """Return the Block reached by following <path> from <board>, or None if
+    there is no such Block on <board>.
+    """
+    block = board
+    for index in path:
+        children = block.children
+        if len(children) == 0:
+            return None
+        block = children[index]
+    return block
+
+
+def decode_move(code: int, board: Block) -> \
+        Optional[Tuple[str, Optional[int], Block]]:
+    """Return the move of <code> on <board>, or None if the path of <code>
+    does not reach a Block of <board>.
+
+    Precondition: <board> is the root of its tree.
+
+    >>> board = Block((0, 0), 750, None, 0, 2)
+    >>> board.smash()
+    True
+    >>> copy = board.create_copy()
+    >>> move = decode_move(encode_move(('swap', 0, board.children[1])), copy)
+    >>> move[2] is copy.children[1]
+    True
+    """
+    (action, direction), path = decode(code)
+    block = find_block(board, path)
+    if block is None:
+        return None
+    return action, direction, block
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', 'actions', 'block'
+        ],
+        'max-attributes': 15
+    })
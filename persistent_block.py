@@ -0,0 +1,324 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the PersistentBlock class, a Blocky board that is never
+changed once it is made.
+
+Making a move on a PersistentBlock gives a new board, and the old one stays as
+it was. The new board only has new Blocks on the path from its root down to
+the moved Block, and shares every other subtree with the old board, so a move
+costs a few new Blocks for each level rather than a copy of the whole board.
+
+A shared Block can be in many boards, so it keeps neither a parent nor a
+position. Whatever depends on where a Block is, like its position or the
+order of its children after a rotate higher up, is passed down from the root
+while walking the board instead.
+"""
+from __future__ import annotations
+from typing import Iterator, List, Optional, Tuple
+import random
+import math
+
+from block import Block, Raster
+from moves import decode
+from settings import COLOUR_LIST
+
+
+def from_block(block: Block) -> PersistentBlock:
+    """Return a PersistentBlock equivalent to the tree rooted at <block>.
+
+    >>> board = Block((0, 0), 750, None, 0, 1)
+    >>> board.children = [Block((0, 0), 375, colour, 1, 1)
+    ...                   for colour in [(1, 1, 1), (2, 2, 2), (1, 1, 1),
+    ...                                  (3, 3, 3)]]
+    >>> from_block(board).to_block() == board
+    True
+    """
+    return PersistentBlock(block.size, block.colour, block.level,
+                           block.max_depth,
+                           tuple(from_block(child) for child in block.children))
+
+
+class PersistentBlock:
+    """A square Block in the Blocky game, represented as a tree that is never
+    changed once it is made.
+
+    === Public Attributes ===
+    size:
+        The height and width of this square Block.
+    colour:
+        If this block is not subdivided, <colour> stores its colour. Otherwise,
+        <colour> is None.
+    level:
+        The level of this block within the overall block structure.
+    max_depth:
+        The deepest level allowed in the overall block structure.
+
+    === Representation Invariants ===
+    - The attributes of a PersistentBlock are never changed.
+    - The same invariants as for Block, other than those about position.
+    """
+    # === Private Attributes ===
+    # _children:
+    #   The four children of this Block, before its turns are applied, or an
+    #   empty tuple if this Block has no children.
+    # _turns:
+    #   The number of clockwise quarter turns of this Block and all its
+    #   descendants that are not yet applied to the order of <_children>.
+    #   Each child must also be rotated by this many turns when they are.
+    #
+    # === Private Representation Invariants ===
+    # - 0 <= _turns < 4
+    # - If _children is empty, then _turns == 0.
+    size: int
+    colour: Optional[Tuple[int, int, int]]
+    level: int
+    max_depth: int
+    _children: Tuple[PersistentBlock, ...]
+    _turns: int
+
+    def __init__(self, size: int, colour: Optional[Tuple[int, int, int]],
+                 level: int, max_depth: int,
+                 children: Tuple[PersistentBlock, ...] = (),
+                 turns: int = 0) -> None:
+        """Initialize this Block with dimensions <size> by <size>, the given
+        <colour>, at <level>, with <children> rotated by <turns> quarter
+        turns clockwise.
+
+        Preconditions:
+            - size > 0
+            - level >= 0
+            - max_depth >= level
+            - len(children) == 0 or len(children) == 4
+        """
+        self.size = size
+        self.colour = colour
+        self.level = level
+        self.max_depth = max_depth
+        self._children = children
+        self._turns = turns % 4 if children else 0
+
+    @property
+    def children(self) -> List[PersistentBlock]:
+        """The blocks into which this block is subdivided, in this order:
+        upper-right child, upper-left child, lower-left child, lower-right
+        child.
+
+        A child that has to be rotated by this Block's turns is given as a new
+        PersistentBlock, which shares its own children with the stored one.
+        """
+        turns = self._turns
+        if not turns:
+            return list(self._children)
+        children = self._children[turns:] + self._children[:turns]
+        return [child._turned(turns) for child in children]
+
+    def _turned(self, turns: int) -> PersistentBlock:
+        """Return this Block rotated clockwise by <turns> quarter turns.
+        """
+        if not self._children or turns % 4 == 0:
+            return self
+        return PersistentBlock(self.size, None, self.level, self.max_depth,
+                               self._children, self._turns + turns)
+
+    def __eq__(self, other: PersistentBlock) -> bool:
+        """Return True iff this Block and all its descendents are equivalent to
+        the <other> Block and all its descendents.
+        """
+        if self is other:
+            return True
+        if self.size != other.size or self.colour != other.colour or \
+                self.level != other.level or \
+                self.max_depth != other.max_depth:
+            return False
+        return self.children == other.children
+
+    def leaf_cells(self) -> Iterator[Tuple[Tuple[int, int, int], int, int,
+                                           int]]:
+        """Yield a (colour, column, row, width) tuple for every leaf below or
+        at this Block, measured in unit cells from the upper left corner of
+        this Block, as Block.leaf_cells does.
+        """
+        stack = [(self, 0, 0, 2 ** (self.max_depth - self.level))]
+        while stack:
+            block, x, y, width = stack.pop()
+            children = block.children
+            if not children:
+                yield block.colour, x, y, width
+            else:
+                half = width // 2
+                stack.append((children[0], x + half, y, half))
+                stack.append((children[1], x, y, half))
+                stack.append((children[2], x, y + half, half))
+                stack.append((children[3], x + half, y + half, half))
+
+    def raster(self) -> Raster:
+        """Return the unit cells of this Block as a new Raster.
+        """
+        raster = Raster(2 ** (self.max_depth - self.level))
+        raster.fill(self, 0, 0)
+        return raster
+
+    def to_block(self, position: Tuple[int, int] = (0, 0)) -> Block:
+        """Return a new Block tree equivalent to this Block, with its upper
+        left corner at <position>.
+        """
+        block = Block(position, self.size, self.colour, self.level,
+                      self.max_depth)
+        children = self.children
+        if children:
+            x, y = position
+            half = children[0].size
+            block.children = [
+                children[0].to_block((x + half, y)),
+                children[1].to_block(position),
+                children[2].to_block((x, y + half)),
+                children[3].to_block((x + half, y + half))]
+        return block
+
+    def apply_move(self, code: int,
+                   colour: Optional[Tuple[int, int, int]] = None) -> \
+            Optional[PersistentBlock]:
+        """Return the board made by making the move with <code>, as given by
+        moves.encode, on this board, or None if the move can't be made.
+        <colour> is the colour used by a paint move.
+
+        This board is not changed, and every subtree the move leaves alone is
+        shared by the new board.
+
+        >>> from moves import encode
+        >>> board = PersistentBlock(750, None, 0, 1, tuple(
+        ...     PersistentBlock(375, colour, 1, 1)
+        ...     for colour in [(1, 1, 1), (2, 2, 2), (1, 1, 1), (3, 3, 3)]))
+        >>> after = board.apply_move(encode(('paint', None), [1]), (1, 1, 1))
+        >>> after.children[1].colour
+        (1, 1, 1)
+        >>> after.children[3] is board.children[3]
+        True
+        >>> board.children[1].colour
+        (2, 2, 2)
+        """
+        (action, direction), path = decode(code)
+        return self._apply(path, 0, action, direction, colour)
+
+    def _apply(self, path: List[int], step: int, action: str,
+               direction: Optional[int],
+               colour: Optional[Tuple[int, int, int]]) -> \
+            Optional[PersistentBlock]:
+        """Return this Block after the move <action> in <direction> is made on
+        the Block reached by following path[step:] from this Block, or None if
+        the move can't be made.
+        """
+        if step == len(path):
+            return self._moved(action, direction, colour)
+        children = self.children
+        if not children:
+            return None
+        index = path[step]
+        child = children[index]._apply(path, step + 1, action, direction,
+                                       colour)
+        if child is None:
+            return None
+        children[index] = child
+        return PersistentBlock(self.size, None, self.level, self.max_depth,
+                               tuple(children))
+
+    def _moved(self, action: str, direction: Optional[int],
+               colour: Optional[Tuple[int, int, int]]) -> \
+            Optional[PersistentBlock]:
+        """Return this Block after the move <action> in <direction> is made on
+        it, or None if the move can't be made, as in Block.apply_move.
+        """
+        if action == 'rotate':
+            if self._children:
+                return self._turned(direction)
+        elif action == 'swap':
+            c = self.children
+            if c and direction == 0:
+                return self._with_children((c[1], c[0], c[3], c[2]))
+            elif c and direction == 1:
+                return self._with_children((c[3], c[2], c[1], c[0]))
+        elif action == 'smash':
+            if self.level != self.max_depth and not self._children:
+                return self._smashed()
+        elif action == 'paint':
+            if self.level == self.max_depth and self.colour != colour:
+                return PersistentBlock(self.size, colour, self.level,
+                                       self.max_depth)
+        elif action == 'combine':
+            if self.level == self.max_depth - 1:
+                majority = self._majority_colour()
+                if majority is not None:
+                    return PersistentBlock(self.size, majority, self.level,
+                                           self.max_depth)
+        return None
+
+    def _with_children(self, children: Tuple[PersistentBlock, ...]) -> \
+            PersistentBlock:
+        """Return a Block like this one, but with <children>.
+        """
+        return PersistentBlock(self.size, None, self.level, self.max_depth,
+                               children)
+
+    def _smashed(self) -> PersistentBlock:
+        """Return this Block sub-divided into four randomly generated
+        children, using the random state just as Block.smash does.
+
+        Precondition: this Block has no children and its level is not
+        max_depth.
+        """
+        num = math.exp(-0.25 * self.level)
+        size = self.size // 2
+        children = [PersistentBlock(size, random.choice(COLOUR_LIST),
+                                    self.level + 1, self.max_depth)
+                    for _ in range(4)]
+        for i in range(4):
+            if random.random() < num and \
+                    children[i].level != children[i].max_depth:
+                children[i] = children[i]._smashed()
+        return self._with_children(tuple(children))
+
+    def _majority_colour(self) -> Optional[Tuple[int, int, int]]:
+        """Return the colour that more of this Block's children have than any
+        other colour, or None if there is no such colour or this Block has no
+        children.
+        """
+        colours = [child.colour for child in self._children]
+        if not colours:
+            return None
+        counts = [colours.count(c) for c in colours]
+        best = max(counts)
+        if counts.count(best) != best:
+            # Another colour has as many children as the most common one.
+            return None
+        return colours[counts.index(best)]
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
+            'block', 'moves', 'settings'
+        ],
+        'max-attributes': 15,
+        'max-args': 6
+    })
@@ -22,15 +22,24 @@ Misha Schwartz, and Jaisie Sin.
 This file contains the hierarchy of player classes.
 """
 from __future__ import annotations
-from typing import List, Optional, Tuple
+from collections import deque
+from concurrent.futures import Executor
+from typing import Collection, Dict, Iterator, List, Optional, Set, Tuple
+import itertools
+import math
 import random
+import time
 import pygame
 
-from block import Block
-from goal import Goal, generate_goals
+from bitboard import score_moves
+from block import Block, MoveUndo
+from goal import Goal, PerimeterGoal, generate_goals
+from linear_board import LinearBoard, from_block
+from moves import decode_move, encode, encode_move
 
-from actions import KEY_ACTION, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
-    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE
+from actions import ACTION_PENALTY, KEY_ACTION, ROTATE_CLOCKWISE, \
+    ROTATE_COUNTER_CLOCKWISE, SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, \
+    PAINT, COMBINE
 
 
 def create_players(num_human: int, num_random: int, smart_players: List[int]) \
@@ -81,20 +90,84 @@ def _get_block(block: Block, location: Tuple[int, int], level: int) -> \
     Preconditions:
         - 0 <= level <= max_depth
     """
-    x = block.position[0]
-    y = block.position[1]
-    if level == 0 and x <= location[0] < x + block.size \
-            and y <= location[1] < y + block.size:
-        return block
-    elif level > 0 and x <= location[0] < x + block.size \
-            and y <= location[1] < y + block.size and (not block.children):
-        return block
-    else:
-        for child in block.children:
-            result = _get_block(child, location, level - 1)
-            if result is not None:
-                return result
-    return None
+    x, y = location
+    # The position of each Block on the way down is worked out from that of
+    # its parent.
+    left, top = block.position
+    while True:
+        if not (left <= x < left + block.size and top <= y < top + block.size):
+            return None
+        children = block.children
+        if level == 0 or not children:
+            return block
+        # Only the child on the same side of the middle of <block> as
+        # <location> can include it.
+        index = _child_index(children, left, top, x, y)
+        left, top = _child_position(children, left, top, index)
+        block = children[index]
+        level -= 1
+
+
+def _child_index(children: List[Block], left: int, top: int, x: int,
+                 y: int) -> int:
+    """Return the index of the one of <children> that is on the same sides of
+    the middle of their parent as (<x>, <y>), where (<left>, <top>) is the
+    position of their parent.
+    """
+    half = children[0].size
+    if x >= left + half:
+        return 3 if y >= top + half else 0
+    return 2 if y >= top + half else 1
+
+
+def _child_position(children: List[Block], left: int, top: int,
+                    index: int) -> Tuple[int, int]:
+    """Return the position of the child at <index> in <children>, where
+    (<left>, <top>) is the position of their parent.
+    """
+    half = children[0].size
+    if index in (0, 3):
+        left += half
+    if index in (2, 3):
+        top += half
+    return left, top
+
+
+def _get_blocks(block: Block, locations: List[Tuple[int, int]],
+                level: int) -> List[Optional[Block]]:
+    """Return the Block that _get_block(<block>, location, <level>) would
+    return for each location in <locations>, in the same order.
+
+    The locations are split between the children of each Block together, so
+    each Block on the way down is only looked at once for all of them.
+
+    Preconditions:
+        - 0 <= level <= max_depth
+    """
+    result = [None] * len(locations)
+    stack = [(block, block.position, level, list(range(len(locations))))]
+    while stack:
+        block, (left, top), level, indices = stack.pop()
+        right = left + block.size
+        bottom = top + block.size
+        inside = [i for i in indices
+                  if left <= locations[i][0] < right and
+                  top <= locations[i][1] < bottom]
+        children = block.children
+        if level == 0 or not children:
+            for i in inside:
+                result[i] = block
+            continue
+        groups = [[], [], [], []]
+        for i in inside:
+            groups[_child_index(children, left, top,
+                                *locations[i])].append(i)
+        for index, group in enumerate(groups):
+            if group:
+                stack.append((children[index],
+                              _child_position(children, left, top, index),
+                              level - 1, group))
+    return result
 
 
 def _list_valid_moves(colour: Tuple[int, int, int], board: Block) -> \
@@ -102,34 +175,172 @@ def _list_valid_moves(colour: Tuple[int, int, int], board: Block) -> \
     """ A helper function for RandomPlayer's make_move,
     which makes a random move on a given block
     """
-    blocks = _list_all_blocks(board)
-    moves = []
-    for block in blocks:
-        if len(block.children) != 0:
-            moves.append(_create_move(ROTATE_COUNTER_CLOCKWISE, block))
-            moves.append(_create_move(ROTATE_CLOCKWISE, block))
-            moves.append(_create_move(SWAP_VERTICAL, block))
-            moves.append(_create_move(SWAP_HORIZONTAL, block))
-        if block.level == block.max_depth and block.colour != colour:
-            moves.append(_create_move(PAINT, block))
-        if block.level != block.max_depth and len(block.children) == 0:
-            moves.append(_create_move(SMASH, block))
-        copy = block.create_copy()
-        if copy.combine():
-            moves.append(_create_move(COMBINE, block))
-    return moves
-
-
-def _list_all_blocks(block: Block) -> List[Block]:
-    """ Return a list of all list_blocks in block
+    return list(_generate_moves(colour, board))
+
+
+def _generate_moves(colour: Tuple[int, int, int], board: Block,
+                    actions: Optional[Collection[Tuple[str, Optional[int]]]]
+                    = None,
+                    levels: Optional[Collection[int]] = None,
+                    by_level: bool = False) -> \
+        Iterator[Tuple[str, Optional[int], Block]]:
+    """Yield the valid moves on <board> one at a time, for a player whose goal
+    has <colour>, without changing <board>.
+
+    The blocks of <board> are visited parent first, and the moves on each
+    block are yielded in this order: rotate counter-clockwise, rotate
+    clockwise, swap vertically, swap horizontally, paint, smash, combine.
+    If <by_level> is True, every block at one level is visited before any
+    block at the level below.
+
+    If <actions> is given, only moves with those actions are yielded. If
+    <levels> is given, only moves on blocks at those levels are yielded.
+    """
+    if actions is None:
+        actions = [ROTATE_COUNTER_CLOCKWISE, ROTATE_CLOCKWISE, SWAP_VERTICAL,
+                   SWAP_HORIZONTAL, PAINT, SMASH, COMBINE]
+    blocks = deque([board])
+    while blocks:
+        if by_level:
+            block = blocks.popleft()
+            children = block.children
+            blocks.extend(children)
+        else:
+            block = blocks.pop()
+            children = block.children
+            blocks.extend(reversed(children))
+        if levels is not None and block.level not in levels:
+            continue
+        for action in actions:
+            if action in (ROTATE_COUNTER_CLOCKWISE, ROTATE_CLOCKWISE,
+                          SWAP_VERTICAL, SWAP_HORIZONTAL):
+                valid = len(children) != 0
+            elif action == PAINT:
+                valid = block.level == block.max_depth and \
+                    block.colour != colour
+            elif action == SMASH:
+                valid = block.level != block.max_depth and \
+                    len(children) == 0
+            elif action == COMBINE:
+                valid = block.can_combine()
+            else:
+                valid = False
+            if valid:
+                yield _create_move(action, block)
+
+
+class PrunedMoves:
+    """The valid moves on a board, leaving out moves that give the same score
+    for a goal as a move that is kept.
+
+    A move is left out if it is on a Block that doesn't touch the edge of the
+    board and the goal is a PerimeterGoal, or if it leaves the board the same
+    as a move that was kept, such as rotating a Block whose children all
+    match. Smashes give random children, so they are only left out for the
+    first reason.
+
+    Iterating makes each move on a copy of the board and undoes it there to
+    see the board it gives, so the board itself is not changed. The moves kept
+    are found on the board by their paths, so the board must not be changed
+    while it is being iterated.
+
+    === Public Attributes ===
+    pruned:
+        The number of moves left out so far by the current iteration.
+    """
+    # === Private Attributes ===
+    # _goal:
+    #   The goal the moves are scored for.
+    # _colour:
+    #   The colour used by paint moves.
+    # _board:
+    #   The board the moves are on.
+    # _actions:
+    #   The actions to keep moves of, or None to keep moves of every action.
+    # _levels:
+    #   The levels to keep moves on, or None to keep moves on every level.
+    # _by_level:
+    #   True iff the moves are in order of the levels of their Blocks.
+    pruned: int
+    _goal: Goal
+    _colour: Tuple[int, int, int]
+    _board: Block
+    _actions: Optional[Collection[Tuple[str, Optional[int]]]]
+    _levels: Optional[Collection[int]]
+    _by_level: bool
+
+    def __init__(self, goal: Goal, board: Block,
+                 actions: Optional[Collection[Tuple[str, Optional[int]]]]
+                 = None,
+                 levels: Optional[Collection[int]] = None,
+                 colour: Optional[Tuple[int, int, int]] = None,
+                 by_level: bool = False) -> None:
+        """Initialize the moves on <board> for <goal>, with <actions>,
+        <levels> and <by_level> as in _generate_moves.
+
+        Paint moves use <colour>, or the colour of <goal> if <colour> is None.
+        This lets the moves of another player be pruned for <goal>.
+
+        Precondition: <board> is the root of its tree.
+        """
+        self.pruned = 0
+        self._goal = goal
+        self._colour = goal.colour if colour is None else colour
+        self._board = board
+        self._actions = actions
+        self._levels = levels
+        self._by_level = by_level
+
+    def __iter__(self) -> Iterator[Tuple[str, Optional[int], Block]]:
+        """Yield the moves that are kept, in the order of _generate_moves.
+        """
+        self.pruned = 0
+        colour = self._colour
+        perimeter = isinstance(self._goal, PerimeterGoal)
+        board = self._board
+        copy = board.create_copy()
+        length = 2 ** (board.max_depth - board.level)
+        seen = set()
+        for move in _generate_moves(colour, copy, self._actions,
+                                    self._levels, self._by_level):
+            action, direction, block = move
+            if perimeter:
+                x, y, width = block.cell_region()
+                if x != 0 and y != 0 and x + width != length and \
+                        y + width != length:
+                    self.pruned += 1
+                    continue
+            if action != SMASH[0]:
+                undo = block.apply_move(action, direction, colour)
+                key = copy.structural_hash()
+                undo.undo()
+                if key in seen:
+                    self.pruned += 1
+                    continue
+                seen.add(key)
+            yield decode_move(encode_move(move), board)
+
+
+# The number of moves in each shard that SmartPlayer sends to its pool.
+_SHARD_SIZE = 32
+
+# The number of moves SmartPlayer scores in its first batch, and at most in
+# each later batch, between checks of its time limit.
+_FIRST_BATCH_SIZE = 8
+_BATCH_SIZE = 64
+
+
+def _score_shard(board: LinearBoard, goal_class: type,
+                 colour: Tuple[int, int, int], codes: List[int]) -> List[int]:
+    """Return the score after each move in <codes> on <board> of a goal of
+    <goal_class> with <colour>, as score_moves would.
+
+    This is run by the workers of a SmartPlayer's pool, so all its arguments
+    are small to send to another process.
     """
-    # if len(block.children) == 0:
-    #     return [block]
-    list_blocks = [block]
-    for child in block.children:
-        list_blocks.append(child)
-        list_blocks.extend(_list_all_blocks(child))
-    return list_blocks
+    block = board.to_block()
+    moves = [decode_move(code, block) for code in codes]
+    return score_moves(block, goal_class(colour), moves)
 
 
 class Player:
@@ -285,13 +496,15 @@ class RandomPlayer(Player):
         """
         if not self._proceed:
             return None  # Do not remove
-        moves = _list_valid_moves(self.goal.colour, board)
         self._proceed = False
-        if moves:
-            move = random.choice(moves)
-            return move
-        else:
-            return None
+        # Keep each move seen so far with probability 1 / (moves seen), so
+        # that every move is equally likely without listing them all.
+        move = None
+        for count, candidate in enumerate(
+                _generate_moves(self.goal.colour, board), 1):
+            if random.randrange(count) == 0:
+                move = candidate
+        return move
 
 
 class SmartPlayer(Player):
@@ -299,6 +512,10 @@ class SmartPlayer(Player):
     It generates a set of random moves and, for each move, checks what its
     score would be if it were to make that move. Then it picks the one that
     yields the best score.
+
+    === Public Attributes ===
+    candidates_examined:
+        The number of moves scored for the last move.
     """
     # === Private Attributes ===
     # _proceed:
@@ -306,15 +523,45 @@ class SmartPlayer(Player):
     #   wait.
     # _difficulty:
     #   The number of valid moves in the block
+    # _pool:
+    #   The executor to score moves on in parallel, or None to score them in
+    #   this process.
+    # _time_limit:
+    #   The number of milliseconds to spend scoring moves, or None for no
+    #   limit.
+    # _prune:
+    #   True iff moves that score the same as another move are left out.
+    candidates_examined: int
     _proceed: bool
     _difficulty: int
-
-    def __init__(self, player_id: int, goal: Goal, difficulty: int) -> None:
+    _pool: Optional[Executor]
+    _time_limit: Optional[int]
+    _prune: bool
+
+    def __init__(self, player_id: int, goal: Goal, difficulty: int,
+                 pool: Optional[Executor] = None,
+                 time_limit: Optional[int] = None,
+                 prune: bool = False) -> None:
         """Initialize this SmartPlayer with the given <renderer>, <player_id>,
-        <goal> and <difficulty>."""
+        <goal> and <difficulty>.
+
+        If <pool> is given, such as a concurrent.futures.ProcessPoolExecutor,
+        the moves are scored on it in shards. The moves chosen are the same
+        as without it.
+
+        If <time_limit> is given, moves are scored in batches, from the moves
+        on the largest Blocks down, until <difficulty> moves have been scored
+        or <time_limit> milliseconds have passed.
+
+        If <prune> is True, moves that score the same as another move are left
+        out, as by PrunedMoves, so that the moves scored are all different."""
         Player.__init__(self, player_id, goal)
+        self.candidates_examined = 0
         self._difficulty = difficulty
         self._proceed = False
+        self._pool = pool
+        self._time_limit = time_limit
+        self._prune = prune
 
     def get_selected_block(self, board: Block) -> Optional[Block]:
         return None
@@ -324,16 +571,94 @@ class SmartPlayer(Player):
             self._proceed = True
 
     def _num_moves(self, copy: Block, n: int) -> List:
-        """ Return a list of n number of valid moves with given block copy.
+        """ Return a list of n number of valid moves with given block copy,
+        leaving out moves that score the same as one in the list if this
+        player prunes its moves.
         """
-        list_moves = _list_valid_moves(self.goal.colour, copy)
-        i = 0
-        use_moves = []
-        if len(list_moves) != 0:
-            while len(use_moves) != n and len(use_moves) != len(list_moves):
-                use_moves.append(list_moves[i])
-                i += 1
-        return use_moves
+        return list(itertools.islice(self._candidates(copy), n))
+
+    def _candidates(self, board: Block, by_level: bool = False) -> \
+            Iterator[Tuple[str, Optional[int], Block]]:
+        """Return an iterator over the valid moves on <board> that this player
+        considers, with <by_level> as in _generate_moves.
+        """
+        if self._prune:
+            return iter(PrunedMoves(self.goal, board, by_level=by_level))
+        return _generate_moves(self.goal.colour, board, by_level=by_level)
+
+    def _moves_in_time(self, board: Block) -> \
+            Tuple[List[Tuple[str, Optional[int], Block]], List[int]]:
+        """Return the moves on <board> scored before this player's time limit
+        ran out, and their scores.
+
+        Moves on Blocks at each level are scored before moves on the level
+        below, since moving a larger Block changes more of the board. The
+        moves are scored in batches, each sized to fit in the time left at
+        the rate moves have been scored so far, and at least one batch is
+        scored. At most <difficulty> moves are scored, chosen as in
+        _num_moves.
+        """
+        start = time.perf_counter()
+        deadline = start + self._time_limit / 1000
+        copy = board.create_copy()
+        moves = []
+        scores = []
+        size = _FIRST_BATCH_SIZE
+        candidates = self._candidates(board, by_level=True)
+        while len(moves) < self._difficulty:
+            batch = list(itertools.islice(
+                candidates, min(size, self._difficulty - len(moves))))
+            if not batch:
+                break
+            moves.extend(batch)
+            scores.extend(self._score_moves(board, batch, copy))
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            size = max(1, min(_BATCH_SIZE, int(
+                len(moves) * (deadline - now) / (now - start))))
+        return moves, scores
+
+    def _score_moves(self, board: Block,
+                     moves: List[Tuple[str, Optional[int], Block]],
+                     copy: Optional[Block] = None) -> List[int]:
+        """Return the score of this player's goal after each of <moves> on
+        <board>.
+
+        Each move is found by its path on one copy of <board>, then made,
+        scored and undone there, so <board> itself is not changed. The copy
+        is <copy> if it is given, or a new one.
+
+        With a pool, shards of the moves are sent to it as move codes, along
+        with <board> as a LinearBoard, which is much smaller to send than a
+        tree of Blocks. Smashes are still scored here, in order, so that they
+        use the random state just as they would without a pool.
+        """
+        if copy is None:
+            copy = board.create_copy()
+        replayed = [decode_move(encode_move(move), copy) for move in moves]
+        if self._pool is None or len(moves) <= _SHARD_SIZE:
+            return score_moves(copy, self.goal, replayed)
+
+        linear = from_block(board)
+        scores = [0] * len(moves)
+        shards = []
+        for start in range(0, len(moves), _SHARD_SIZE):
+            indices = [i for i in range(start, min(start + _SHARD_SIZE,
+                                                   len(moves)))
+                       if moves[i][0] != SMASH[0]]
+            codes = [encode_move(moves[i]) for i in indices]
+            shards.append((indices, self._pool.submit(
+                _score_shard, linear, type(self.goal), self.goal.colour,
+                codes)))
+        smashes = [i for i in range(len(moves)) if moves[i][0] == SMASH[0]]
+        for i, score in zip(smashes, score_moves(
+                copy, self.goal, [replayed[i] for i in smashes])):
+            scores[i] = score
+        for indices, future in shards:
+            for i, score in zip(indices, future.result()):
+                scores[i] = score
+        return scores
 
     def generate_move(self, board: Block) -> \
             Optional[Tuple[str, Optional[int], Block]]:
@@ -347,46 +672,19 @@ class SmartPlayer(Player):
 
         This function does not mutate <board>.
         """
-        # find random n blocks(put into a list), check the first
-        # valid move(put in a list, but if same block cant have same valid move,
-        # use the copy to find the score,
-        # put the scores in a list. Find the max score i. Use that i
+        # check the first n valid moves, scoring each exactly once, and put
+        # the scores in a list. Find the max score i. Use that i
         # to find the 'action' in the list of moves.
         if not self._proceed:
             return None
         self._proceed = False
-        copy = board.create_copy()
-        blocks_moves = self._num_moves(board, self._difficulty)
-        score_lst = []
+        if self._time_limit is None:
+            blocks_moves = self._num_moves(board, self._difficulty)
+            score_lst = self._score_moves(board, blocks_moves)
+        else:
+            blocks_moves, score_lst = self._moves_in_time(board)
+        self.candidates_examined = len(blocks_moves)
         max_ = 0
-        use_moves = self._num_moves(copy, self._difficulty)
-        use_moves_len = len(use_moves)
-        for i in range(use_moves_len):
-            use_moves = self._num_moves(copy, self._difficulty)
-            move = use_moves[i]
-            block = use_moves[i][2]
-            if move == _create_move(SMASH, block):
-                block.smash()
-                score_lst.append(self.goal.score(copy))
-            if move == _create_move(COMBINE, block):
-                block.combine()
-                score_lst.append(self.goal.score(copy))
-            if move == _create_move(PAINT, block):
-                block.paint(self.goal.colour)
-                score_lst.append(self.goal.score(copy))
-            if move == _create_move(ROTATE_CLOCKWISE, block):
-                block.rotate(1)
-                score_lst.append(self.goal.score(copy))
-            if move == _create_move(ROTATE_COUNTER_CLOCKWISE, block):
-                block.rotate(3)
-                score_lst.append(self.goal.score(copy))
-            if move == _create_move(SWAP_VERTICAL, block):
-                block.swap(1)
-                score_lst.append(self.goal.score(copy))
-            if move == _create_move(SWAP_HORIZONTAL, block):
-                block.swap(0)
-                score_lst.append(self.goal.score(copy))
-            copy = board.create_copy()
         index_best = 0
         if len(score_lst) != 0:
             max_ = max(score_lst)
@@ -397,15 +695,562 @@ class SmartPlayer(Player):
             return blocks_moves[index_best]
 
 
+# The number of random outcomes of a smash that SearchPlayer averages over.
+_SMASH_SAMPLES = 2
+
+# The number of moves SearchPlayer searches past the next turn from each board,
+# taking the moves whose value after that turn alone is best first.
+_SEARCH_WIDTH = 12
+
+# Kinds of value kept in SearchPlayer's transposition table: the exact value
+# of a board, or a bound on it found when the search of the board was cut off.
+_EXACT = 0
+_LOWER = 1
+_UPPER = 2
+
+
+class SearchPlayer(Player):
+    """A computer player that looks several turns ahead.
+
+    It searches the moves of every player in turn order, assuming that the
+    other players all try to make its score as low as possible, and that a
+    smash gives the average of a few random outcomes. Searches of deeper and
+    deeper turns are made one after another until <depth> turns have been
+    searched or the budget runs out, and the best move of the deepest search
+    that finished is made.
+
+    Every move of the last turn is scored, all together on one Bitboard. On
+    each earlier turn, the moves are scored the same way as if the game ended
+    after them, and only the few that look best are searched further, since
+    there are far too many to search them all.
+
+    === Public Attributes ===
+    goals:
+        The goals of all the players in the game, in turn order. This
+        player's goal is one of them.
+    nodes:
+        The number of boards looked at by the last search.
+    """
+    # === Private Attributes ===
+    # _proceed:
+    #   True when the player should make a move, False when the player should
+    #   wait.
+    # _depth:
+    #   The number of turns to look ahead, counting this player's.
+    # _time_limit:
+    #   The number of milliseconds a search may take, or None for no limit.
+    # _max_nodes:
+    #   The number of boards a search may look at, or None for no limit.
+    # _deadline:
+    #   The time.perf_counter() value the current search must stop by, or
+    #   None.
+    # _stopped:
+    #   True iff the current search ran out of budget.
+    # _table:
+    #   The transposition table of the current search. It maps the hash of a
+    #   board, the index in <goals> of the player to move and the number of
+    #   turns left to the value of the board, the kind of value, and the code
+    #   of the best move found. The best move found with one turn fewer left
+    #   is searched first.
+    goals: List[Goal]
+    nodes: int
+    _proceed: bool
+    _depth: int
+    _time_limit: Optional[int]
+    _max_nodes: Optional[int]
+    _deadline: Optional[float]
+    _stopped: bool
+    _table: Dict[Tuple[int, int, int], Tuple[float, int, Optional[int]]]
+
+    def __init__(self, player_id: int, goal: Goal, depth: int,
+                 time_limit: Optional[int] = 1000,
+                 max_nodes: Optional[int] = None) -> None:
+        """Initialize this SearchPlayer with the given <player_id>, <goal> and
+        <depth>, and a budget of <time_limit> milliseconds and <max_nodes>
+        boards per move.
+
+        Until <goals> is set, this player assumes it is the only player.
+
+        Precondition: depth >= 1
+        """
+        Player.__init__(self, player_id, goal)
+        self.goals = [goal]
+        self.nodes = 0
+        self._proceed = False
+        self._depth = depth
+        self._time_limit = time_limit
+        self._max_nodes = max_nodes
+        self._deadline = None
+        self._stopped = False
+        self._table = {}
+
+    def get_selected_block(self, board: Block) -> Optional[Block]:
+        return None
+
+    def process_event(self, event: pygame.event.Event) -> None:
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self._proceed = True
+
+    def generate_move(self, board: Block) -> \
+            Optional[Tuple[str, Optional[int], Block]]:
+        """Return the move that the deepest search finished in the budget
+        found best for this player's score, counting penalties.
+
+        The search makes and undoes moves on one copy of <board>, so this
+        function does not mutate <board>.
+        """
+        if not self._proceed:
+            return None
+        self._proceed = False
+        self.nodes = 0
+        self._stopped = False
+        self._table = {}
+        self._deadline = None
+        if self._time_limit is not None:
+            self._deadline = time.perf_counter() + self._time_limit / 1000
+        copy = board.create_copy()
+        turn = self.goals.index(self.goal)
+        best = encode(PASS, [])
+        for depth in range(1, self._depth + 1):
+            code = self._value(copy, turn, depth, -math.inf, math.inf)[1]
+            if self._stopped:
+                break
+            best = code
+        return decode_move(best, board)
+
+    def _out_of_budget(self) -> bool:
+        """Return True iff the current search must stop.
+        """
+        if self._max_nodes is not None and self.nodes >= self._max_nodes:
+            return True
+        return self._deadline is not None and \
+            time.perf_counter() >= self._deadline
+
+    def _value(self, board: Block, turn: int, depth: int, alpha: float,
+               beta: float) -> Tuple[float, Optional[int]]:
+        """Return the value of <board> for this player when the player at
+        <turn> in <goals> is to move and <depth> turns are left, not counting
+        the penalties of moves already made, and the code of the best move
+        found for the player at <turn>.
+
+        The value is exact if it is strictly between <alpha> and <beta>.
+        Otherwise it is only known to be at most <alpha> or at least <beta>.
+
+        Precondition: depth >= 1
+        """
+        if self._out_of_budget():
+            self._stopped = True
+        if self._stopped:
+            return 0, None
+        board_hash = board.structural_hash()
+        key = (board_hash, turn, depth)
+        entry = self._table.get(key)
+        if entry is not None:
+            value, kind, best_code = entry
+            if kind == _EXACT or (kind == _LOWER and value >= beta) or \
+                    (kind == _UPPER and value <= alpha):
+                return value, best_code
+        else:
+            entry = self._table.get((board_hash, turn, depth - 1))
+        maximise = self.goals[turn] is self.goal
+        moves = self._scored_moves(board, turn)
+        if self._out_of_budget():
+            self._stopped = True
+            return 0, None
+        if maximise:
+            moves.sort(key=lambda scored: -scored[0])
+        else:
+            moves.sort(key=lambda scored: scored[0])
+        if depth == 1:
+            self._table[key] = (moves[0][0], _EXACT, moves[0][1])
+            return moves[0][0], moves[0][1]
+
+        if entry is not None:
+            # Search the best move found before first, as it most likely
+            # narrows the window the most.
+            moves.sort(key=lambda scored: scored[1] != entry[2])
+        start_alpha, start_beta = alpha, beta
+        best = -math.inf if maximise else math.inf
+        best_code = None
+        seen = set()
+        searched = 0
+        for _, code, move in moves:
+            if searched == _SEARCH_WIDTH:
+                break
+            value = self._move_value(board, turn, depth, move, alpha, beta,
+                                     seen)
+            if self._stopped:
+                return 0, None
+            if value is None:
+                continue
+            searched += 1
+            if (maximise and value > best) or (not maximise and value < best):
+                best = value
+                best_code = code
+            if maximise:
+                alpha = max(alpha, best)
+            else:
+                beta = min(beta, best)
+            if alpha >= beta:
+                break
+        if best <= start_alpha:
+            kind = _UPPER
+        elif best >= start_beta:
+            kind = _LOWER
+        else:
+            kind = _EXACT
+        self._table[key] = (best, kind, best_code)
+        return best, best_code
+
+    def _scored_moves(self, board: Block, turn: int) -> \
+            List[Tuple[float, int, Tuple[str, Optional[int], Block]]]:
+        """Return the value for this player of each move the player at <turn>
+        in <goals> could make on <board>, passing included, if the game ended
+        after it, with the code of the move and the move itself.
+
+        The value counts the penalty of the move if this player makes it, and
+        the value of a smash is the average of a few random outcomes. Every
+        move is counted as a board looked at.
+        """
+        colour = self.goals[turn].colour
+        moves = list(_generate_moves(colour, board))
+        moves.append(_create_move(PASS, board))
+        batch = []
+        for move in moves:
+            if move[0] == SMASH[0]:
+                batch.extend([move] * _SMASH_SAMPLES)
+            else:
+                batch.append(move)
+        self.nodes += len(batch)
+        scores = iter(score_moves(board, self.goal, batch, colour))
+        own = self.goals[turn] is self.goal
+        result = []
+        for move in moves:
+            if move[0] == SMASH[0]:
+                value = sum(next(scores)
+                            for _ in range(_SMASH_SAMPLES)) / _SMASH_SAMPLES
+            else:
+                value = next(scores)
+            if own:
+                value -= ACTION_PENALTY[move[:2]]
+            result.append((value, encode_move(move), move))
+        return result
+
+    def _move_value(self, board: Block, turn: int, depth: int,
+                    move: Tuple[str, Optional[int], Block], alpha: float,
+                    beta: float, seen: Set[int]) -> Optional[float]:
+        """Return the value for this player of the player at <turn> in <goals>
+        making <move> on <board> with <depth> turns left, counting the
+        penalty of <move> if this player makes it.
+
+        Return None instead if the move gives a board whose hash is in <seen>,
+        and otherwise add the hash of that board to <seen>. Smashes give
+        random boards, so they are always searched.
+
+        <alpha> and <beta> are as in _value.
+        """
+        action, direction, block = move
+        after = (turn + 1) % len(self.goals)
+        penalty = 0
+        if self.goals[turn] is self.goal:
+            penalty = ACTION_PENALTY[(action, direction)]
+        if action == SMASH[0]:
+            # The children are random, so average a few of them with a full
+            # window, as a bound from one outcome says nothing of the others.
+            total = 0
+            for _ in range(_SMASH_SAMPLES):
+                undo = block.apply_move(action, direction)
+                total += self._value(board, after, depth - 1, -math.inf,
+                                     math.inf)[0]
+                undo.undo()
+            return total / _SMASH_SAMPLES - penalty
+        undo = None
+        if action != PASS[0]:
+            undo = block.apply_move(action, direction,
+                                    self.goals[turn].colour)
+        board_hash = board.structural_hash()
+        if board_hash in seen:
+            value = None
+        else:
+            seen.add(board_hash)
+            value = self._value(board, after, depth - 1, alpha + penalty,
+                                beta + penalty)[0] - penalty
+        if undo is not None:
+            undo.undo()
+        return value
+
+
+class _Node:
+    """A node of the tree searched by MCTSPlayer, standing for the boards
+    reached by one sequence of moves from the board at the root.
+
+    Smashes give random children, so the same sequence of moves can reach
+    different boards, and the moves tried from a node are the valid ones on
+    the board reached this time.
+
+    === Public Attributes ===
+    turn:
+        The index in MCTSPlayer.goals of the player to move.
+    board_hash:
+        The hash of the board the first time this node was reached.
+    children:
+        The node reached by each move tried so far, by the code of the move.
+    visits:
+        The number of playouts made through this node.
+    totals:
+        The sum of the rewards of those playouts for each player, in the
+        order of MCTSPlayer.goals.
+    """
+    turn: int
+    board_hash: int
+    children: Dict[int, _Node]
+    visits: int
+    totals: List[float]
+
+    def __init__(self, turn: int, board_hash: int, players: int) -> None:
+        """Initialize an unvisited node for a game of <players> players, with
+        the player at <turn> to move on the board with hash <board_hash>.
+        """
+        self.turn = turn
+        self.board_hash = board_hash
+        self.children = {}
+        self.visits = 0
+        self.totals = [0.0] * players
+
+
+class MCTSPlayer(Player):
+    """A computer player that plays many random games from the board, and
+    makes the move that was tried most.
+
+    The moves of each random game are picked by upper confidence bounds
+    (UCT) while they are in the tree of moves tried so far, and then like a
+    RandomPlayer for a few turns. Each player's reward is its score minus
+    its penalties at the end, over the number of unit cells on the board.
+
+    === Public Attributes ===
+    goals:
+        The goals of all the players in the game, in turn order. This
+        player's goal is one of them.
+    playouts:
+        The number of random games played for the last move.
+    playouts_per_second:
+        The number of random games played per second for the last move.
+    """
+    # === Private Attributes ===
+    # _proceed:
+    #   True when the player should make a move, False when the player should
+    #   wait.
+    # _time_limit:
+    #   The number of milliseconds to play random games for, or None for no
+    #   limit.
+    # _max_playouts:
+    #   The number of random games to play, or None for no limit.
+    # _playout_turns:
+    #   The number of turns played like a RandomPlayer after leaving the tree.
+    # _exploration:
+    #   How much UCT favours moves that have been tried less.
+    # _root:
+    #   The node of the move made last time, to find this turn's tree in, or
+    #   None.
+    # _move_cache:
+    #   The valid moves found by _moves at each node this turn, by the id of
+    #   the node.
+    goals: List[Goal]
+    playouts: int
+    playouts_per_second: float
+    _proceed: bool
+    _time_limit: Optional[int]
+    _max_playouts: Optional[int]
+    _playout_turns: int
+    _exploration: float
+    _root: Optional[_Node]
+    _move_cache: Dict[int, Dict[int, Tuple[str, Optional[int], Block]]]
+
+    def __init__(self, player_id: int, goal: Goal,
+                 time_limit: Optional[int] = 1000,
+                 max_playouts: Optional[int] = None, playout_turns: int = 2,
+                 exploration: float = math.sqrt(2)) -> None:
+        """Initialize this MCTSPlayer with the given <player_id> and <goal>,
+        playing random games of <playout_turns> turns past the tree for
+        <time_limit> milliseconds or until <max_playouts> have been played.
+
+        Until <goals> is set, this player assumes it is the only player.
+
+        Precondition: time_limit is not None or max_playouts is not None
+        """
+        Player.__init__(self, player_id, goal)
+        self.goals = [goal]
+        self.playouts = 0
+        self.playouts_per_second = 0.0
+        self._proceed = False
+        self._time_limit = time_limit
+        self._max_playouts = max_playouts
+        self._playout_turns = playout_turns
+        self._exploration = exploration
+        self._root = None
+        self._move_cache = {}
+
+    def get_selected_block(self, board: Block) -> Optional[Block]:
+        return None
+
+    def process_event(self, event: pygame.event.Event) -> None:
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self._proceed = True
+
+    def generate_move(self, board: Block) -> \
+            Optional[Tuple[str, Optional[int], Block]]:
+        """Return the valid move tried in the most random games from <board>,
+        or pass if no move was tried.
+
+        The random games make and undo moves on one copy of <board>, so this
+        function does not mutate <board>.
+        """
+        if not self._proceed:
+            return None
+        self._proceed = False
+        copy = board.create_copy()
+        self._move_cache = {}
+        turn = self.goals.index(self.goal)
+        root = self._find_root(copy.structural_hash(), turn)
+        start = time.perf_counter()
+        deadline = None
+        if self._time_limit is not None:
+            deadline = start + self._time_limit / 1000
+        self.playouts = 0
+        while (self._max_playouts is None or
+               self.playouts < self._max_playouts) and \
+                (deadline is None or time.perf_counter() < deadline):
+            self._play(copy, root)
+            self.playouts += 1
+        elapsed = time.perf_counter() - start
+        self.playouts_per_second = self.playouts / elapsed if elapsed else 0.0
+
+        valid = self._moves(copy, root, True)
+        tried = [code for code in root.children if code in valid]
+        if not tried:
+            self._root = None
+            return _create_move(PASS, board)
+        best = max(tried, key=lambda code: root.children[code].visits)
+        self._root = root.children[best]
+        return decode_move(best, board)
+
+    def _find_root(self, board_hash: int, turn: int) -> _Node:
+        """Return the node of the tree kept from the last move for the board
+        with <board_hash> when the player at <turn> is to move, or a new node
+        if there is none.
+        """
+        nodes = [] if self._root is None else [self._root]
+        # The other players have moved once each since the last move.
+        for _ in range(len(self.goals) - 1):
+            nodes = [child for node in nodes
+                     for child in node.children.values()]
+        for node in nodes:
+            if node.turn == turn and node.board_hash == board_hash:
+                return node
+        return _Node(turn, board_hash, len(self.goals))
+
+    def _moves(self, board: Block, node: _Node, cache: bool) -> \
+            Dict[int, Tuple[str, Optional[int], Block]]:
+        """Return the valid moves of the player to move at <node> on <board>,
+        passing included, by their codes.
+
+        No moves are left out for giving the same score as another, as in
+        PrunedMoves: a move that changes nothing for the player's goal now can
+        still matter once later moves have been made.
+
+        If <cache> is True, the moves are kept for the next time <node> is
+        reached this turn. This is only safe if no smash was made on the way
+        to <node>: the same moves then always move the same Blocks of this
+        turn's copy of the board into the same places.
+        """
+        if cache and id(node) in self._move_cache:
+            return self._move_cache[id(node)]
+        moves = {encode_move(move): move for move in
+                 _generate_moves(self.goals[node.turn].colour, board)}
+        moves[encode(PASS, [])] = _create_move(PASS, board)
+        if cache:
+            self._move_cache[id(node)] = moves
+        return moves
+
+    def _play(self, board: Block, root: _Node) -> None:
+        """Play one random game on <board> from <root>, add a node for the
+        first move that leaves the tree, and add the rewards of the game to
+        every node on the way. <board> ends up as it was.
+        """
+        players = len(self.goals)
+        undos = []
+        penalties = [0] * players
+        path = [root]
+        node = root
+        while True:
+            # A smash makes new Blocks, which are gone once it is undone.
+            moves = self._moves(board, node,
+                                all(undo.action != SMASH[0] for undo in undos))
+            untried = [code for code in moves if code not in node.children]
+            if untried:
+                code = random.choice(untried)
+                self._make(board, moves[code], node.turn, penalties, undos)
+                child = _Node((node.turn + 1) % players,
+                              board.structural_hash(), players)
+                node.children[code] = child
+                path.append(child)
+                break
+            code = max(moves, key=lambda c: self._bound(node,
+                                                        node.children[c]))
+            self._make(board, moves[code], node.turn, penalties, undos)
+            node = node.children[code]
+            path.append(node)
+
+        turn = path[-1].turn
+        for _ in range(self._playout_turns):
+            # Pick a valid move at random, as a RandomPlayer does.
+            moves = list(_generate_moves(self.goals[turn].colour, board))
+            if moves:
+                self._make(board, random.choice(moves), turn, penalties,
+                           undos)
+            turn = (turn + 1) % players
+
+        cells = 4 ** (board.max_depth - board.level)
+        rewards = [(goal.score(board) - penalty) / cells
+                   for goal, penalty in zip(self.goals, penalties)]
+        for undo in reversed(undos):
+            undo.undo()
+        for node in path:
+            node.visits += 1
+            for i in range(players):
+                node.totals[i] += rewards[i]
+
+    def _bound(self, node: _Node, child: _Node) -> float:
+        """Return the upper confidence bound of the reward of the player to
+        move at <node> for the move to <child>.
+        """
+        return child.totals[node.turn] / child.visits + self._exploration * \
+            math.sqrt(math.log(node.visits) / child.visits)
+
+    def _make(self, board: Block, move: Tuple[str, Optional[int], Block],
+              turn: int, penalties: List[int], undos: List[MoveUndo]) -> None:
+        """Make <move> on <board> for the player at <turn>, adding its
+        penalty to <penalties> and its undo record to <undos>.
+        """
+        action, direction, block = move
+        if action == PASS[0]:
+            return
+        undo = block.apply_move(action, direction, self.goals[turn].colour)
+        if undo is not None:
+            penalties[turn] += ACTION_PENALTY[(action, direction)]
+            undos.append(undo)
+
+
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
         'allowed-io': ['process_event'],
         'allowed-import-modules': [
-            'doctest', 'python_ta', 'random', 'typing', 'actions', 'block',
-            'goal', 'pygame', '__future__'
+            'doctest', 'python_ta', 'random', 'typing', 'actions', 'bitboard',
+            'block', 'collections', 'concurrent.futures', 'goal', 'itertools',
+            'linear_board', 'math', 'moves', 'pygame', 'time', '__future__'
         ],
-        'max-attributes': 10,
+        'max-attributes': 15,
         'generated-members': 'pygame.*'
     })
@@ -21,7 +21,7 @@ Misha Schwartz, and Jaisie Sin.
 
 This file contains the global settings for the blocky game.
 """
-from typing import Tuple
+from typing import Dict, Tuple
 
 # Colours that we could use in the game
 WHITE = (255, 255, 255)
@@ -55,6 +55,11 @@ HIGHLIGHT_THICKNESS = 5
 # The number of seconds a move is animated for.
 ANIMATION_DURATION = 1
 
+# Goal scores are cached in at most about this many bytes of memory. Looking
+# a score up costs about as much as working it out on boards that are rarely
+# scored twice, so the cache is off unless this is set above 0.
+SCORE_CACHE_BYTES = 0
+
 
 def colour_name(colour: Tuple[int, int, int]) -> str:
     """Return the colour name associated with this colour value, or the empty
@@ -76,3 +81,35 @@ def colour_name(colour: Tuple[int, int, int]) -> str:
         return colour_names[colour]
     else:
         return ''
+
+
+# The number of colour values that colour_id can give an id to. A raster
+# stores each id in one byte.
+MAX_COLOUR_IDS = 256
+
+# The id given by colour_id to every colour value that has one.
+_COLOUR_IDS: Dict[Tuple[int, int, int], int] = \
+    {colour: i for i, colour in enumerate(COLOUR_LIST)}
+
+
+def colour_id(colour: Tuple[int, int, int]) -> int:
+    """Return a small integer that identifies this colour value: its index in
+    COLOUR_LIST, or the next unused id if this colour value isn't in our
+    colour list.
+
+    Raise a ValueError if this colour value has no id and MAX_COLOUR_IDS
+    colour values already have one.
+
+    >>> colour_id(PACIFIC_POINT)
+    0
+    >>> colour_id(DAFFODIL_DELIGHT)
+    3
+    """
+    ident = _COLOUR_IDS.get(colour)
+    if ident is None:
+        if len(_COLOUR_IDS) == MAX_COLOUR_IDS:
+            raise ValueError(f'no more than {MAX_COLOUR_IDS} colours can be '
+                             f'given an id')
+        ident = len(_COLOUR_IDS)
+        _COLOUR_IDS[colour] = ident
+    return ident